@@ -1,7 +1,8 @@
 import streamlit as st
 from st_social_media_links import SocialMediaIcons
 
-def app():
+# The About page is the same for every site
+def app(site=None):
 
     # Language selection
     lang = st.selectbox("Select Language / Pilih Bahasa", ["Bahasa Indonesia", "English"])
@@ -0,0 +1,164 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from profiling import timed
+from sites import MAX_ACTIVE_SITES
+from web_function import INDICATOR_COLUMNS, derived_is_fresh, load_data
+
+UPWELLING = 'BERPOTENSI UPWELLING'
+
+# Aggregation periods and the pandas period each one groups by. Seasons are the
+# meteorological quarters DJF, MAM, JJA and SON, labelled by their first day.
+PERIODS = {'weekly': 'W', 'monthly': 'M', 'seasonal': 'Q-NOV'}
+
+STATISTICS = ['mean', 'min', 'max']
+
+
+def aggregates_path(file_path):
+    # Aggregate cube written next to the CSV by ingest.py
+    return os.path.splitext(file_path)[0] + '.aggregates.npz'
+
+
+def _sparse_table(values, reduce):
+    # table[j, i] = reduce(values[i:i + 2**j]); any range is covered by two overlapping blocks.
+    # Rows of level j past len(values) - 2**j are padding and never read.
+    levels = max(len(values), 1).bit_length()
+    table = np.full((levels,) + values.shape, np.nan)
+    table[0] = values
+    for level in range(1, levels):
+        width = 1 << (level - 1)
+        table[level, :len(values) - 2 * width + 1] = reduce(table[level - 1, :len(values) - 2 * width + 1],
+                                                             table[level - 1, width:len(values) - width + 1])
+    return table
+
+
+# Daily indicators of the historical table with everything a range query needs
+# precomputed once (at ingest): prefix sums for means and upwelling-day counts,
+# sparse tables for min/max and the first row of every week, month and season.
+# A date range is located with two binary searches and its statistics come from
+# a constant number of lookups, so no query rescans the daily rows; per-period
+# tables cost one vectorized lookup per period, with partial periods at the
+# ends of the range clipped to it.
+class AggregateCube:
+    def __init__(self, dates, sums, events, minimum, maximum, periods):
+        self.dates = dates  # datetime64[ns], sorted
+        self.sums = sums  # (days + 1, indicators) prefix sums in INDICATOR_COLUMNS order
+        self.events = events  # (days + 1,) prefix counts of potential upwelling days
+        self.minimum = minimum  # Sparse tables, see _sparse_table
+        self.maximum = maximum
+        self.periods = periods  # name -> (period starts, first row of each period)
+
+    @classmethod
+    def from_history(cls, history):
+        history = history.sort_values('DATE')
+        dates = history['DATE'].to_numpy().astype('datetime64[ns]')
+        values = history[INDICATOR_COLUMNS].to_numpy(dtype='float64')
+        upwelling = history['Status'].astype(str).to_numpy() == UPWELLING
+        sums = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+        events = np.concatenate([[0], np.cumsum(upwelling, dtype='int64')])
+        periods = {}
+        for name, freq in PERIODS.items():
+            keys = history['DATE'].dt.to_period(freq).dt.start_time.to_numpy().astype('datetime64[ns]')
+            first = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+            periods[name] = (keys[first], first)
+        return cls(dates, sums, events, _sparse_table(values, np.minimum), _sparse_table(values, np.maximum), periods)
+
+    def save(self, path):
+        arrays = {'dates': self.dates.astype('int64'), 'sums': self.sums, 'events': self.events,
+                  'minimum': self.minimum, 'maximum': self.maximum}
+        for name, (starts, first) in self.periods.items():
+            arrays[f'{name}_start'] = starts.astype('int64')
+            arrays[f'{name}_first'] = first
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            periods = {name: (data[f'{name}_start'].astype('datetime64[ns]'), data[f'{name}_first'])
+                       for name in PERIODS}
+            return cls(data['dates'].astype('datetime64[ns]'), data['sums'], data['events'],
+                       data['minimum'], data['maximum'], periods)
+
+    def bounds(self, start=None, end=None):
+        # Row positions [lo, hi) of the days between start and end (inclusive)
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(start, 'ns'), side='left'))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(end, 'ns'), side='right'))
+        return lo, max(lo, hi)
+
+    def _stats(self, lo, hi):
+        # Statistics of the row ranges [lo, hi) (arrays of equal length, all non-empty)
+        days = hi - lo
+        level = np.frexp(days)[1] - 1  # floor(log2(days)), exact for integers
+        last = hi - (1 << level)
+        stats = {
+            'mean': (self.sums[hi] - self.sums[lo]) / days[:, None],
+            'min': np.minimum(self.minimum[level, lo], self.minimum[level, last]),
+            'max': np.maximum(self.maximum[level, lo], self.maximum[level, last]),
+        }
+        return stats, days, self.events[hi] - self.events[lo]
+
+    def summary(self, start=None, end=None):
+        # Mean, min and max of every indicator plus the day and upwelling-day counts of a range
+        lo, hi = self.bounds(start, end)
+        if hi == lo:
+            return pd.DataFrame(np.nan, index=INDICATOR_COLUMNS, columns=STATISTICS), 0, 0
+        stats, days, events = self._stats(np.array([lo]), np.array([hi]))
+        table = pd.DataFrame({statistic: stats[statistic][0] for statistic in STATISTICS}, index=INDICATOR_COLUMNS)
+        return table, int(days[0]), int(events[0])
+
+    @timed
+    def table(self, period, start=None, end=None):
+        # Statistics per week, month or season of the days between start and end
+        starts, first = self.periods[period]
+        lo, hi = self.bounds(start, end)
+        p_lo = max(int(np.searchsorted(first, lo, side='right')) - 1, 0)
+        p_hi = int(np.searchsorted(first, hi, side='left')) if hi > lo else p_lo
+        row_lo = np.maximum(first[p_lo:p_hi], lo)
+        row_hi = np.minimum(np.append(first[p_lo + 1:p_hi], hi), hi)
+        columns = {}
+        if p_hi > p_lo:
+            stats, days, events = self._stats(row_lo, row_hi)
+        else:
+            stats = {statistic: np.empty((0, len(INDICATOR_COLUMNS))) for statistic in STATISTICS}
+            days = events = np.empty(0, dtype=np.int64)
+        for statistic in STATISTICS:
+            for i, column in enumerate(INDICATOR_COLUMNS):
+                columns[f'{column}_{statistic}'] = stats[statistic][:, i]
+        columns['days'] = days
+        columns['upwelling_days'] = events
+        return pd.DataFrame(columns, index=pd.DatetimeIndex(starts[p_lo:p_hi], name='DATE'))
+
+
+# Cubes shared by every session, keyed by CSV path and tied to the frame load_data returned:
+# a changed file is reloaded by load_data and then gets a new cube. The least recently
+# used sites' cubes are dropped beyond MAX_ACTIVE_SITES.
+_cubes = OrderedDict()
+_cubes_lock = threading.Lock()
+
+@timed
+def get_cube(file_path):
+    history = load_data(file_path)
+    with _cubes_lock:
+        entry = _cubes.get(file_path)
+        if entry is not None and entry[0] is history:
+            _cubes.move_to_end(file_path)
+            return entry[1]
+    path = aggregates_path(file_path)
+    cube = None
+    if derived_is_fresh(path, file_path):
+        cube = AggregateCube.load(path)
+        # Rows appended by power_ingest.py are not in the stored cube
+        if len(cube.dates) != len(history) or cube.dates[-1] != history['DATE'].to_numpy()[-1]:
+            cube = None
+    if cube is None:
+        cube = AggregateCube.from_history(history)
+    with _cubes_lock:
+        _cubes[file_path] = (history, cube)
+        _cubes.move_to_end(file_path)
+        while len(_cubes) > MAX_ACTIVE_SITES:
+            _cubes.popitem(last=False)
+    return cube
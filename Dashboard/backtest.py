@@ -0,0 +1,132 @@
+"""Rolling-origin backtest of the forecast + classifier pipeline.
+
+Run from the repository root::
+
+    python Dashboard/backtest.py --window 730 --horizon 30 --step 30
+
+For every origin, a VAR(k_ar) is fitted on the preceding `window` days of
+the site's HASIL_CLUSTERING.csv (--site, default laut-tawar) and forecasts
+the next `horizon` days. The forecast days are classified by the site's SVM
+and compared with the known Status. The SVM is also scored on the observed
+indicators of the same days, which separates forecast error from classifier
+error.
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import model_registry
+from model_update import VarState, lagged_regressors
+from sites import DEFAULT_SITE_ID, get_site
+from web_function import INDICATOR_COLUMNS, MODEL_FEATURES, load_data
+
+
+def _window_stats(values, start, stop, k_ar):
+    # Z'Z and Z'Y of the VAR regression for the targets values[start:stop]
+    regressors, targets = lagged_regressors(values[start - k_ar:stop], k_ar)
+    return regressors.T @ regressors, regressors.T @ targets
+
+
+def forecast_block(values, dates, origins, window, horizon, k_ar):
+    # Forecasts for a run of increasing origins. The sufficient statistics of the
+    # first window are built once; each following window adds the days that enter
+    # and subtracts the days that leave instead of refitting from scratch.
+    forecasts = []
+    zz = zy = None
+    previous = None
+    for origin in origins:
+        if zz is None or origin - previous >= window - k_ar:
+            zz, zy = _window_stats(values, origin - window + k_ar, origin, k_ar)
+        else:
+            entering = _window_stats(values, previous, origin, k_ar)
+            leaving = _window_stats(values, previous - window + k_ar, origin - window + k_ar, k_ar)
+            zz = zz + entering[0] - leaving[0]
+            zy = zy + entering[1] - leaving[1]
+        previous = origin
+
+        state = VarState(k_ar, zz, zy, values[origin - k_ar:origin], dates[origin - 1], window - k_ar)
+        forecasts.append(state.forecaster().forecast(horizon).to_numpy())
+    return forecasts
+
+
+# Worker-side copy of the history, sent once per worker process
+_history = {}
+
+def _init_worker(values, dates):
+    _history['values'] = values
+    _history['dates'] = dates
+
+
+def _run_block(job):
+    origins, window, horizon, k_ar = job
+    return forecast_block(_history['values'], _history['dates'], origins, window, horizon, k_ar)
+
+
+def run_forecasts(values, dates, origins, window, horizon, k_ar, workers=None):
+    # Origins are split into contiguous blocks so that every block still reuses its
+    # state between adjacent windows; --workers 1 runs a single block in-process
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1:
+        return forecast_block(values, dates, origins, window, horizon, k_ar)
+    blocks = [list(block) for block in np.array_split(origins, min(len(origins), workers * 2)) if len(block)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(values, dates)) as pool:
+        results = pool.map(_run_block, [(block, window, horizon, k_ar) for block in blocks])
+        return [forecast for block in results for forecast in block]
+
+
+def backtest(history, model, window=730, horizon=30, step=30, k_ar=8, workers=None):
+    values = history[INDICATOR_COLUMNS].to_numpy(dtype='float64')
+    dates = history['DATE'].to_numpy()
+    origins = list(range(window, len(values) - horizon + 1, step))
+    forecasts = run_forecasts(values, dates, origins, window, horizon, k_ar, workers)
+
+    # Classify every forecast day and every observed day with one predict call each
+    feature_index = [INDICATOR_COLUMNS.index(column) for column in MODEL_FEATURES]
+    forecast_matrix = np.vstack(forecasts)
+    positions = np.concatenate([np.arange(origin, origin + horizon) for origin in origins])
+    predicted = model.predict(forecast_matrix[:, feature_index]).reshape(len(origins), horizon)
+    observed = model.predict(values[positions][:, feature_index]).reshape(len(origins), horizon)
+    actual = history['Status'].astype(str).to_numpy()[positions].reshape(len(origins), horizon)
+
+    scale = values.std(axis=0)
+    errors = (forecast_matrix - values[positions]).reshape(len(origins), horizon, -1) / scale
+    return pd.DataFrame({
+        'origin': pd.DatetimeIndex(dates[origins]),
+        'accuracy_forecast': (predicted == actual).mean(axis=1),
+        'accuracy_observed': (observed == actual).mean(axis=1),
+        'upwelling_days_actual': (actual == 'BERPOTENSI UPWELLING').sum(axis=1),
+        'upwelling_days_forecast': (predicted == 'BERPOTENSI UPWELLING').sum(axis=1),
+        'rmse_standardized': np.sqrt((errors ** 2).mean(axis=(1, 2))),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--site', default=DEFAULT_SITE_ID, help='site whose history and classifier are tested')
+    parser.add_argument('--window', type=int, default=730, help='training days per window')
+    parser.add_argument('--horizon', type=int, default=30, help='forecast days per window')
+    parser.add_argument('--step', type=int, default=30, help='days between adjacent origins')
+    parser.add_argument('--k-ar', type=int, default=8, help='VAR lag order')
+    parser.add_argument('--workers', type=int, default=None, help='default: all cores; 1 = serial')
+    parser.add_argument('--output', default=None, help='optional CSV file for the per-window results')
+    args = parser.parse_args()
+
+    site = get_site(args.site)
+    history = load_data(site.history_path)
+    model = model_registry.get_model(site.model_path)
+    results = backtest(history, model, window=args.window, horizon=args.horizon, step=args.step,
+                       k_ar=args.k_ar, workers=args.workers)
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+    print(f"{len(results)} windows from {results['origin'].iloc[0].date()} to {results['origin'].iloc[-1].date()}")
+    print(f"Accuracy on forecast indicators: {results['accuracy_forecast'].mean():.3f}")
+    print(f"Accuracy on observed indicators: {results['accuracy_observed'].mean():.3f}")
+    print(f"Standardized forecast RMSE:      {results['rmse_standardized'].mean():.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""Micro-benchmarks for the dashboard hot paths.
+
+Run from the repository root, e.g.::
+
+    python Dashboard/benchmark.py predict
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+MODEL_PATH = 'Dashboard/data/model_klasifikasi.pkl'
+HISTORY_PATH = 'Dashboard/data/HASIL_CLUSTERING.csv'
+
+
+def best_of(func, repeat=3):
+    # Best wall time over several runs, returning the last result as well
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def make_input_data(days):
+    # Realistic inputs: the historical indicators tiled over the requested number of days
+    history = pd.read_csv(HISTORY_PATH)
+    rows = history.iloc[np.arange(days) % len(history)]
+    dates = pd.date_range('2024-01-01', periods=days).strftime('%d/%m/%Y')
+    return [
+        {
+            'DATE': date,
+            'Indeks Kejernihan Langit': float(row.ALLSKY_KT),
+            'Suhu Pada Ketinggian 2 Meter': float(row.T2M),
+            'Curah Hujan': float(row.PRECTOTCORR),
+            'Tekanan Permukaan': float(row.PS),
+            'Kecepatan Angin': float(row.WS10M),
+        }
+        for date, row in zip(dates, rows.itertuples())
+    ]
+
+
+def predict_per_row(model, input_data):
+    # The original Prediction page loop: one predict call and one concat per day. It only
+    # produces DATE, the indicators and Prediksi (no probability or cluster columns).
+    import predict
+    columns = ['DATE'] + predict.INDICATOR_COLUMNS + ['Prediksi']
+    all_data = pd.DataFrame(columns=columns)
+    for data in input_data:
+        input_array = np.array([[data['Indeks Kejernihan Langit'], data['Suhu Pada Ketinggian 2 Meter'],
+                                 data['Kecepatan Angin'], data['Curah Hujan'], data['Tekanan Permukaan']]])
+        new_data = {column: [data[column]] for column in columns[:-1]}
+        new_data['Prediksi'] = predict.predict(model, input_array)[0]
+        all_data = pd.concat([all_data, pd.DataFrame(new_data)], ignore_index=True)
+    return all_data
+
+
+def bench_predict(args):
+    import model_registry
+    import predict
+
+    model = model_registry.get_model(MODEL_PATH)
+    print(f"{'days':>6} {'per-row (s)':>12} {'batch (s)':>10} {'speedup':>8}  match")
+    for days in args.days:
+        input_data = make_input_data(days)
+        per_row_time, per_row = best_of(lambda: predict_per_row(model, input_data), repeat=1)
+        batch_time, batch = best_of(lambda: predict.predict_batch(model, input_data))
+        # Only the columns both paths produce are compared, in the date order the page shows
+        per_row = per_row.sort_values(by=['DATE'], kind='stable', ignore_index=True)
+        match = per_row.astype(object).equals(batch[per_row.columns].astype(object))
+        print(f"{days:>6} {per_row_time:>12.4f} {batch_time:>10.4f} {per_row_time / batch_time:>7.1f}x  {match}")
+
+
+# Loads one dataset in a fresh interpreter and prints the RSS growth it caused
+_RSS_SNIPPET = """
+import os, sys
+sys.path.insert(0, 'Dashboard')
+import pandas as pd
+import pyarrow.feather
+import web_function
+
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+spec = web_function.DATASETS[os.path.basename(sys.argv[2])]
+before = rss()
+if sys.argv[1] == 'csv':
+    df = web_function.normalize_dataset(pd.read_csv(sys.argv[2], delimiter=spec['delimiter']), spec)
+else:
+    df = web_function.read_columnar(web_function.columnar_path(sys.argv[2]))
+print(rss() - before)
+"""
+
+
+def rss_delta(fmt, file_path):
+    import subprocess
+    import sys
+    output = subprocess.run([sys.executable, '-W', 'ignore', '-c', _RSS_SNIPPET, fmt, file_path],
+                            capture_output=True, text=True, check=True).stdout
+    return int(output.split()[-1])
+
+
+def bench_storage(args):
+    import os
+    import web_function
+
+    print(f"{'dataset':<45} {'csv (ms)':>9} {'feather (ms)':>13} {'csv RSS (KiB)':>14} {'feather RSS (KiB)':>18}")
+    for name, spec in web_function.DATASETS.items():
+        file_path = os.path.join('Dashboard/data', name)
+        if not os.path.exists(web_function.columnar_path(file_path)):
+            print(f"{name:<45} no columnar copy, run Dashboard/ingest.py first")
+            continue
+        csv_time, _ = best_of(lambda: web_function.normalize_dataset(
+            pd.read_csv(file_path, delimiter=spec['delimiter']), spec), repeat=10)
+        feather_time, _ = best_of(lambda: web_function.read_columnar(web_function.columnar_path(file_path)), repeat=10)
+        csv_rss = rss_delta('csv', file_path) / 1024
+        feather_rss = rss_delta('feather', file_path) / 1024
+        print(f"{name:<45} {csv_time * 1000:>9.2f} {feather_time * 1000:>13.2f} {csv_rss:>14.0f} {feather_rss:>18.0f}")
+
+
+def update_time(state, new_rows, repeat=5):
+    # Best time of VarState.update applied to fresh copies of `state`
+    import copy
+    best = float('inf')
+    for _ in range(repeat):
+        fresh = copy.deepcopy(state)
+        start = time.perf_counter()
+        fresh.update(new_rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_update(args):
+    import model_update
+    import web_function
+    from statsmodels.tsa.api import VAR
+
+    history = web_function.load_data(HISTORY_PATH)
+    k_ar = 8
+    print(f"{'history (days)':>14} {'statsmodels refit (s)':>22} {'stats rebuild (s)':>18} {'update 1 day (ms)':>18} {'update 30 days (ms)':>20}")
+    for days in args.history:
+        # Longer histories are the real one tiled forward in time
+        grown = history.iloc[np.arange(days + 30) % len(history)].reset_index(drop=True)
+        grown['DATE'] = pd.date_range(history['DATE'].iloc[0], periods=len(grown))
+        base, new = grown.iloc[:days], grown.iloc[days:]
+        values = base[web_function.INDICATOR_COLUMNS].to_numpy(dtype='float64')
+
+        refit_time, _ = best_of(lambda: VAR(values).fit(k_ar))
+        rebuild_time, state = best_of(lambda: model_update.VarState.from_history(base, k_ar))
+        one_time = update_time(state, new.iloc[:1])
+        many_time = update_time(state, new)
+        print(f"{days:>14} {refit_time:>22.4f} {rebuild_time:>18.4f} {one_time * 1000:>18.3f} {many_time * 1000:>20.3f}")
+
+
+def bench_charts(args):
+    import plotly.graph_objects as go
+    import plotly.io
+    import chart_data
+    import charts
+    import web_function
+
+    history = web_function.load_data(HISTORY_PATH)
+    columns = web_function.INDICATOR_COLUMNS
+    # The Home page's indicator charts over the whole history, as drawn before the shared-axis
+    # figure (one LTTB-downsampled plotly_dark figure per indicator, "separate") and now (one
+    # figure with a row per indicator, "combined"). "build" is the cache-miss cost of a figure,
+    # "serialize" what st.plotly_chart does with the cached figure on every rerun.
+    print(f"{'points/series':>13} {'separate KiB':>13} {'build ms':>9} {'serialize ms':>13}"
+          f" {'combined KiB':>13} {'build ms':>9} {'serialize ms':>13}")
+    for max_points in [None] + args.points:
+        def build_separate():
+            figures = []
+            for column in columns:
+                if max_points is None:
+                    dates, values = history['DATE'].to_numpy(), history[column].to_numpy()
+                else:
+                    dates, values = chart_data._compute_series(history, column, None, None, max_points,
+                                                               'lttb', 'DATE', None)
+                fig = go.Figure(go.Scatter(x=dates, y=values, mode='lines', name=column))
+                fig.update_layout(title=column, xaxis_title='Tanggal', yaxis_title=column, template='plotly_dark')
+                figures.append(fig)
+            return figures
+
+        def build_combined():
+            chart_data.chart_cache.clear()  # Downsampled series are recomputed, as for separate
+            return [charts._build_combined_figure(history, columns, columns, None, None,
+                                                  max_points or len(history), 'DATE', 'Tanggal', 'plotly_dark')]
+
+        def serialize(figures):
+            return sum(len(plotly.io.to_json(fig.to_dict(), validate=False)) for fig in figures)
+
+        row = []
+        for build in (build_separate, build_combined):
+            build_elapsed, figures = best_of(build)
+            serialize_elapsed, size = best_of(lambda: serialize(figures))
+            row.append(f" {size / 1024:>13.1f} {build_elapsed * 1000:>9.1f} {serialize_elapsed * 1000:>13.1f}")
+        label = 'full' if max_points is None else max_points
+        print(f"{label:>13}" + ''.join(row))
+
+
+def preprocess_reference(df, freq):
+    # The original web_function.preprocess_dataframe: string timestamps parsed per row
+    df = pd.melt(df, id_vars=['date'], var_name='hour', value_name='curah_hujan')
+    df['hour'] = df['hour'].str.replace('hujan_', '')
+    df['hour'] = df['hour'].str.pad(width=4, side='left', fillchar='0')
+    df['waktu'] = pd.to_datetime(df['date'] + ' ' + df['hour'], format='%Y-%m-%d %H%M')
+    df = df.sort_values(by='waktu', ascending=True)
+    df = df.drop(columns=['date', 'hour'])
+    df = df.reset_index(drop=True)
+    df['waktu'] = pd.to_datetime(df['waktu'], format='%Y-%m-%d %H:%M:%S')
+    df.set_index('waktu', inplace=True)
+    if freq:
+        df = df.resample(freq).mean()
+        df['curah_hujan'] = df['curah_hujan'].interpolate()
+    return df
+
+
+def make_hourly_data(days, seed=0):
+    # Wide rainfall table as read from CSV: one row per day, one hujan_<HHMM> column per hour
+    rng = np.random.default_rng(seed)
+    data = {'date': pd.date_range('2000-01-01', periods=days).strftime('%Y-%m-%d')}
+    for hour in range(24):
+        data[f'hujan_{hour * 100}'] = rng.gamma(0.3, 2.0, days).round(1)
+    return pd.DataFrame(data)
+
+
+def bench_preprocess(args):
+    import web_function
+
+    print(f"{'days':>7} {'hourly rows':>12} {'original (s)':>13} {'vectorized (s)':>15} {'chunked (s)':>12} {'equal':>6}")
+    for days in args.days:
+        wide = make_hourly_data(days)
+        original_time, expected = best_of(lambda: preprocess_reference(wide, None))
+        vectorized_time, result = best_of(lambda: web_function.preprocess_dataframe(wide, None))
+        chunk_rows = max(days // 10, 1)
+        chunked_time, chunked = best_of(lambda: web_function.preprocess_dataframe(
+            (wide.iloc[start:start + chunk_rows] for start in range(0, days, chunk_rows)), None))
+        equal = expected.equals(result) and expected.equals(chunked)
+        print(f"{days:>7} {len(expected):>12} {original_time:>13.3f} {vectorized_time:>15.3f} {chunked_time:>12.3f} {str(equal):>6}")
+
+
+BENCHMARKS = {
+    'predict': bench_predict,
+    'storage': bench_storage,
+    'update': bench_update,
+    'charts': bench_charts,
+    'preprocess': bench_preprocess,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 365, 3650])
+    parser.add_argument('--points', type=int, nargs='+', default=[2000, 1000, 500])
+    parser.add_argument('--history', type=int, nargs='+', default=[2557, 10000, 40000, 80000])
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Default number of points sent per series: roughly one per horizontal pixel of a
+# full-width chart. Ranges with fewer points are always sent at full detail, so
+# narrowing the date range ("zooming in") switches back to the raw daily data.
+DEFAULT_MAX_POINTS = 1000
+
+# Point budgets offered by the pages' chart-detail control (None = every point)
+CHART_RESOLUTIONS = {'500': 500, '1000': 1000, '2000': 2000, 'Full': None}
+
+
+def lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: indices of `threshold` points that keep the
+    # visual shape of the line (first and last points are always kept)
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    # Bucket b spans edges[b]:edges[b + 1]; the last edge is n - 1, so the final
+    # "bucket" edges[-1]:n is the last point on its own
+    edges = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.int64) + 1
+
+    # Average point of every bucket, used as the third triangle vertex of the bucket before it
+    counts = np.diff(np.append(edges, n))
+    avg_x = np.add.reduceat(x, edges) / counts
+    avg_y = np.add.reduceat(y, edges) / counts
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    # Small buckets are faster in plain Python than through per-bucket numpy calls
+    small_buckets = (n - 2) / (threshold - 2) < 32
+    if small_buckets:
+        x_list, y_list = x.tolist(), y.tolist()
+    a = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_x, next_y = avg_x[bucket + 1], avg_y[bucket + 1]
+        if small_buckets:
+            ax, ay = x_list[a], y_list[a]
+            best_area, best = -1.0, start
+            for i in range(start, end):
+                area = abs((ax - next_x) * (y_list[i] - ay) - (ax - x_list[i]) * (next_y - ay))
+                if area > best_area:
+                    best_area, best = area, i
+            a = best
+        else:
+            area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+            a = start + int(np.argmax(area))
+        selected[bucket + 1] = a
+    return selected
+
+
+def minmax(y, buckets):
+    # Indices of the minimum and maximum of each bucket, in order: keeps every peak,
+    # which suits marker plots where extremes matter more than the line shape
+    n = len(y)
+    if 2 * buckets >= n:
+        return np.arange(n)
+    y = np.asarray(y, dtype='float64')
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    selected = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            segment = y[start:end]
+            selected += [start + int(np.argmin(segment)), start + int(np.argmax(segment))]
+    return np.unique(selected)
+
+
+# Downsampled series shared by every session, keyed by the source frame and the request.
+# The frame itself is kept in the entry so that a reloaded dataset never hits a stale entry.
+class ChartDataCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, frame, key, compute):
+        full_key = (id(frame),) + key
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None and entry[0] is frame:
+                self._entries.move_to_end(full_key)
+                return entry[1]
+        value = compute()
+        with self._lock:
+            self._entries[full_key] = (frame, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+chart_cache = ChartDataCache()
+
+
+def chart_series(df, column, start=None, end=None, max_points=DEFAULT_MAX_POINTS, method='lttb',
+                 date_column=None, where=None):
+    # (dates, values) of df[column] between start and end, reduced to at most
+    # max_points with LTTB ('lttb') or per-bucket min/max ('minmax').
+    # df is indexed by date unless date_column is given; `where` is an optional
+    # (column, value) filter, e.g. ('Status', 'BERPOTENSI UPWELLING').
+    key = (column, start, end, max_points, method, date_column, where)
+    return chart_cache.get(df, key, lambda: _compute_series(df, column, start, end, max_points,
+                                                            method, date_column, where))
+
+
+def _compute_series(df, column, start, end, max_points, method, date_column, where):
+    dates = (df.index if date_column is None else df[date_column]).to_numpy().astype('datetime64[ns]')
+    values = df[column].to_numpy()
+
+    # Dates are sorted, so the range is two binary searches rather than a mask over the frame
+    lo = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'ns'), side='left')
+    hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end, 'ns'), side='right')
+    dates, values = dates[lo:hi], values[lo:hi]
+    if where is not None:
+        mask = df[where[0]].to_numpy()[lo:hi] == where[1]
+        dates, values = dates[mask], values[mask]
+
+    if method == 'minmax':
+        index = minmax(values, max_points // 2)
+    else:
+        index = lttb(dates.astype(np.int64), values, max_points)
+    return dates[index], values[index]
@@ -0,0 +1,86 @@
+import numpy as np
+
+from chart_data import DEFAULT_MAX_POINTS, chart_cache, chart_series
+from profiling import timed
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Series with at least this many points are drawn with WebGL (Scattergl) traces
+WEBGL_MIN_POINTS = 1000
+
+
+def regular_series(df, column, start=None, end=None, max_points=DEFAULT_MAX_POINTS, date_column=None):
+    # (x0, dx in ms, values) of a gap-free daily series between start and end, or None when
+    # the dates are not evenly spaced or the range has to be downsampled (the kept points
+    # are then no longer evenly spaced either). A trace can be drawn from x0 and dx alone,
+    # without sending any date array.
+    dates = (df.index if date_column is None else df[date_column]).to_numpy().astype('datetime64[ns]')
+    lo = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'ns'), side='left')
+    hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end, 'ns'), side='right')
+    if hi - lo > max_points:
+        return None
+    dates = dates[lo:hi]
+    values = df[column].to_numpy(dtype='float64')[lo:hi]
+    if len(dates) > 1 and not (np.diff(dates) == np.timedelta64(1, 'D')).all():
+        return None
+    if len(values) == 0:
+        return None, DAY_MS, values
+    x0 = str(dates[0])[:10]  # Daily dates: the day is enough for plotly's date axis
+    return x0, DAY_MS, values
+
+
+def combined_figure(df, columns, titles, start=None, end=None, max_points=DEFAULT_MAX_POINTS,
+                    date_column=None, xaxis_title='Tanggal', template='plotly_dark'):
+    # One figure with a row per indicator on a shared date axis. The built figure is
+    # cached per source frame and request and shared by every session: do not modify it.
+    key = ('combined', tuple(columns), tuple(titles), start, end, max_points, date_column, xaxis_title, template)
+    return chart_cache.get(df, key, lambda: _build_combined_figure(
+        df, columns, titles, start, end, max_points, date_column, xaxis_title, template))
+
+
+def _stacked_layout(titles, vertical_spacing=0.06):
+    # The layout make_subplots(rows=len(titles), cols=1, shared_xaxes=True) produces, written
+    # out directly: building it through make_subplots and then update_layout validated the
+    # layout (and the default template) twice
+    rows = len(titles)
+    height = (1 - vertical_spacing * (rows - 1)) / rows
+    layout = {'annotations': []}
+    for row, title in enumerate(titles, start=1):
+        suffix = '' if row == 1 else str(row)
+        top = 1 - (row - 1) * (height + vertical_spacing)
+        xaxis = {'anchor': f'y{suffix}', 'domain': [0.0, 1.0], 'type': 'date'}
+        if row < rows:
+            xaxis.update(matches=f'x{rows}', showticklabels=False)
+        layout[f'xaxis{suffix}'] = xaxis
+        layout[f'yaxis{suffix}'] = {'anchor': f'x{suffix}', 'domain': [max(top - height, 0.0), top]}
+        layout['annotations'].append({'font': {'size': 16}, 'showarrow': False, 'text': title, 'x': 0.5,
+                                      'xanchor': 'center', 'xref': 'paper', 'y': top, 'yanchor': 'bottom',
+                                      'yref': 'paper'})
+    return layout
+
+
+@timed
+def _build_combined_figure(df, columns, titles, start, end, max_points, date_column, xaxis_title, template):
+    import plotly.graph_objects as go
+
+    traces = []
+    for row, column in enumerate(columns, start=1):
+        axes = {'xaxis': f'x{row}' if row > 1 else 'x', 'yaxis': f'y{row}' if row > 1 else 'y'}
+        series = regular_series(df, column, start, end, max_points, date_column)
+        if series is None:
+            # Irregular dates or a downsampled range: LTTB keeps the line's shape with points
+            # at the dates they occurred. The dates are sent as epoch milliseconds, which plotly
+            # serializes as a binary array (8 bytes a point instead of a 21-character string).
+            x, y = chart_series(df, column, start, end, max_points, date_column=date_column)
+            trace_args = {'x': x.astype('datetime64[ms]').astype('int64').astype('float64'), 'y': y}
+        else:
+            x0, dx, y = series
+            trace_args = {'x0': x0, 'dx': dx, 'y': y}
+        trace_type = go.Scattergl if len(y) >= WEBGL_MIN_POINTS else go.Scatter
+        traces.append(trace_type(mode='lines', name=column, **trace_args, **axes))
+
+    layout = _stacked_layout(titles)
+    layout[f'xaxis{len(columns) if len(columns) > 1 else ""}']['title'] = {'text': xaxis_title}
+    layout.update(height=220 * len(columns) + 80, template=template, showlegend=False)
+    # One validation pass over the traces and the layout
+    return go.Figure(data=traces, layout=layout)
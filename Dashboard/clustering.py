@@ -0,0 +1,191 @@
+"""Rerun the k-means clustering behind the Status column of HASIL_CLUSTERING.csv.
+
+Run from the repository root to (re)fit the clusters on a site's history::
+
+    python Dashboard/clustering.py --site laut-tawar
+
+The clusters are fitted on the five indicators of the clustering-labelled
+days, each cluster is named after the Status most of its days have, and the
+state (centroids, per-cluster day counts, names) is written next to the CSV
+as HASIL_CLUSTERING.kmeans.npz. Two clusters on the unscaled indicators give
+back the Status of every day in the CSV; --standardize clusters z-scores
+instead.
+
+New days are labelled with mini-batch updates (KMeansLabeler.partial_fit):
+each batch is assigned to its nearest centroids, which then move to the mean
+of every day they hold, so labelling appended days costs O(batch) rather than
+a refit. power_ingest.py labels the days it appends this way, and the
+Prediction page uses the nearest-centroid assignment as a cross-check of the SVM.
+"""
+import argparse
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from sites import DEFAULT_SITE_ID, MAX_ACTIVE_SITES, get_site
+from web_function import INDICATOR_COLUMNS, derived_is_fresh, load_data
+
+
+def labeler_path(file_path):
+    # Clustering state written next to the history CSV
+    return os.path.splitext(file_path)[0] + '.kmeans.npz'
+
+
+def _sq_distances(X, centroids):
+    # (n, k) squared distances from one matrix product
+    return ((X ** 2).sum(axis=1)[:, None] - 2 * X @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]).clip(0)
+
+
+def _kmeans_plus_plus(X, k, rng):
+    centroids = [X[rng.integers(len(X))]]
+    closest = _sq_distances(X, centroids[0][None, :])[:, 0]
+    for _ in range(1, k):
+        centroids.append(X[rng.choice(len(X), p=closest / closest.sum())])
+        closest = np.minimum(closest, _sq_distances(X, centroids[-1][None, :])[:, 0])
+    return np.array(centroids)
+
+
+def lloyd(X, k, n_init=10, max_iter=300, tol=1e-10, seed=0):
+    # Full-batch k-means (best of n_init k-means++ starts), used once for the initial fit
+    rng = np.random.default_rng(seed)
+    best = None
+    for _ in range(n_init):
+        centroids = _kmeans_plus_plus(X, k, rng)
+        for _ in range(max_iter):
+            labels = _sq_distances(X, centroids).argmin(axis=1)
+            counts = np.bincount(labels, minlength=k)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, X)
+            moved = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centroids)
+            shift = ((moved - centroids) ** 2).sum()
+            centroids = moved
+            if shift <= tol:
+                break
+        distances = _sq_distances(X, centroids)
+        labels = distances.argmin(axis=1)
+        inertia = distances[np.arange(len(X)), labels].sum()
+        if best is None or inertia < best[0]:
+            best = (inertia, centroids, labels)
+    return best[1], best[2]
+
+
+class KMeansLabeler:
+    def __init__(self, centroids, counts, names, mean=None, scale=None):
+        self.centroids = np.asarray(centroids, dtype='float64')  # In the clustered (maybe standardized) space
+        self.counts = np.asarray(counts, dtype='int64')  # Days held by each centroid so far
+        self.names = np.asarray(names, dtype=object)  # Status of each cluster
+        self.mean = mean  # Standardization of the indicators, None for unscaled clusters
+        self.scale = scale
+
+    @classmethod
+    def fit(cls, history, k=2, standardize=False, seed=0):
+        X = history[INDICATOR_COLUMNS].to_numpy(dtype='float64')
+        mean = scale = None
+        if standardize:
+            mean, scale = X.mean(axis=0), X.std(axis=0)
+            X = (X - mean) / scale
+        centroids, labels = lloyd(X, k, seed=seed)
+        # Each cluster is named after the Status most of its days have
+        status = history['Status'].astype(str).to_numpy()
+        names = []
+        for cluster in range(k):
+            values, counts = np.unique(status[labels == cluster], return_counts=True)
+            names.append(values[counts.argmax()] if len(values) else '')
+        return cls(centroids, np.bincount(labels, minlength=k), names, mean, scale), labels
+
+    def _space(self, X):
+        X = np.asarray(X, dtype='float64')
+        return X if self.mean is None else (X - self.mean) / self.scale
+
+    def assign(self, X):
+        # Index of the nearest centroid of every row (X in INDICATOR_COLUMNS order)
+        if len(X) == 0:
+            return np.empty(0, dtype='int64')
+        return _sq_distances(self._space(X), self.centroids).argmin(axis=1)
+
+    def predict(self, X):
+        return self.names[self.assign(X)]
+
+    def partial_fit(self, X):
+        # Mini-batch update: assigns the batch, then moves every centroid to the mean of all
+        # the days it holds (per-centroid learning rate 1/count). Returns the batch's Status.
+        X = self._space(X)
+        if len(X) == 0:
+            return np.empty(0, dtype=object)
+        labels = _sq_distances(X, self.centroids).argmin(axis=1)
+        batch_counts = np.bincount(labels, minlength=len(self.centroids))
+        sums = np.zeros_like(self.centroids)
+        np.add.at(sums, labels, X)
+        self.counts = self.counts + batch_counts
+        touched = batch_counts > 0
+        self.centroids[touched] += ((sums[touched] - batch_counts[touched, None] * self.centroids[touched])
+                                    / self.counts[touched, None])
+        return self.names[labels]
+
+    def save(self, path):
+        arrays = {'centroids': self.centroids, 'counts': self.counts, 'names': self.names.astype(str)}
+        if self.mean is not None:
+            arrays['mean'] = self.mean
+            arrays['scale'] = self.scale
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            scaling = (data['mean'], data['scale']) if 'mean' in data.files else (None, None)
+            return cls(data['centroids'], data['counts'], data['names'].tolist(), *scaling)
+
+
+def load_or_fit(file_path):
+    # Stored state when it is at least as new as the CSV, a fresh fit on the CSV's days otherwise
+    path = labeler_path(file_path)
+    if derived_is_fresh(path, file_path):
+        return KMeansLabeler.load(path)
+    return KMeansLabeler.fit(load_data(file_path, include_parts=False))[0]
+
+
+# Labelers shared by every session, keyed by history path and reloaded when the stored
+# state changes; the least recently used sites' are dropped beyond MAX_ACTIVE_SITES
+_labelers = OrderedDict()
+_labelers_lock = threading.Lock()
+
+def get_labeler(file_path):
+    path = labeler_path(file_path)
+    signature = os.stat(path).st_mtime_ns if derived_is_fresh(path, file_path) else None
+    with _labelers_lock:
+        entry = _labelers.get(file_path)
+        if entry is not None and entry[0] == signature:
+            _labelers.move_to_end(file_path)
+            return entry[1]
+    labeler = load_or_fit(file_path)
+    with _labelers_lock:
+        _labelers[file_path] = (signature, labeler)
+        _labelers.move_to_end(file_path)
+        while len(_labelers) > MAX_ACTIVE_SITES:
+            _labelers.popitem(last=False)
+    return labeler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--site', default=DEFAULT_SITE_ID)
+    parser.add_argument('--clusters', type=int, default=2)
+    parser.add_argument('--standardize', action='store_true', help='cluster z-scores of the indicators')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    site = get_site(args.site)
+    history = load_data(site.history_path, include_parts=False)
+    labeler, labels = KMeansLabeler.fit(history, args.clusters, args.standardize, args.seed)
+    matches = (labeler.names[labels] == history['Status'].astype(str).to_numpy()).sum()
+    target = labeler_path(site.history_path)
+    labeler.save(target)
+    for name, count in zip(labeler.names, labeler.counts):
+        print(f"{name}: {count} days")
+    print(f"{matches}/{len(history)} days keep their Status -> {target}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Select the forecast model by rolling-origin validation over many candidates.
+
+Run from the repository root::
+
+    python Dashboard/ensemble.py --max-order 10 --harmonics 0 1 2 3
+
+Every candidate is a VAR of order 1..max-order, either non-seasonal or with
+annual Fourier terms (sin/cos pairs) as exogenous regressors, which stands in
+for the seasonal VARMA variant of the notebooks. Candidates are scored in a
+process pool that reads the training matrix from shared memory; --workers 1
+runs the same jobs serially in this process. The winner is refitted on the
+whole history and its forecast is written to the site's ensemble_forecast.csv
+(Dashboard/data/ensemble_forecast.csv for the default site; --site picks
+another) for the Forecast page.
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from sites import DATA_DIR, DEFAULT_SITE_ID, ENSEMBLE_FILE, get_site
+from web_function import INDICATOR_COLUMNS, load_data
+
+SUMMARY_FILE = 'ensemble_forecast.json'
+DAYS_PER_YEAR = 365.25
+
+
+def seasonal_terms(t, harmonics):
+    # Annual Fourier terms for day offsets t (days since the first observation)
+    columns = []
+    for harmonic in range(1, harmonics + 1):
+        angle = 2 * np.pi * harmonic * np.asarray(t, dtype='float64') / DAYS_PER_YEAR
+        columns += [np.sin(angle), np.cos(angle)]
+    return np.column_stack(columns) if columns else np.empty((len(t), 0))
+
+
+def fit_candidate(values, k_ar, harmonics):
+    # Least-squares VAR(k_ar) with an intercept and optional seasonal regressors
+    n = len(values)
+    lags = [values[k_ar - lag:n - lag] for lag in range(1, k_ar + 1)]
+    regressors = np.hstack([np.ones((n - k_ar, 1)), seasonal_terms(np.arange(k_ar, n), harmonics)] + lags)
+    params, *_ = np.linalg.lstsq(regressors, values[k_ar:], rcond=None)
+    return params
+
+
+def forecast_candidate(params, values, k_ar, harmonics, steps):
+    # Recursive forecast of the `steps` days following `values`
+    n = len(values)
+    deterministic = np.hstack([np.ones((steps, 1)), seasonal_terms(np.arange(n, n + steps), harmonics)])
+    path = np.vstack([values[-k_ar:], np.empty((steps, values.shape[1]))])
+    for step in range(steps):
+        lags = path[step:k_ar + step][::-1].reshape(-1)  # y[t-1], ..., y[t-k_ar]
+        path[k_ar + step] = np.concatenate([deterministic[step], lags]) @ params
+    return path[k_ar:]
+
+
+def score_candidate(values, k_ar, harmonics, folds, horizon):
+    # Rolling origin: refit on everything before each origin and forecast the next
+    # `horizon` days; the score is the RMSE of the standardized errors over all folds
+    scale = values.std(axis=0)
+    errors = []
+    for fold in range(folds):
+        origin = len(values) - (folds - fold) * horizon
+        params = fit_candidate(values[:origin], k_ar, harmonics)
+        forecast = forecast_candidate(params, values[:origin], k_ar, harmonics, horizon)
+        errors.append((forecast - values[origin:origin + horizon]) / scale)
+    return float(np.sqrt(np.mean(np.square(errors))))
+
+
+# Training matrix of the worker process, attached from shared memory once per worker
+_shared = {}
+
+def _attach(name, shape, dtype):
+    block = shared_memory.SharedMemory(name=name)
+    _shared['block'] = block  # Keep the mapping alive for the lifetime of the worker
+    _shared['values'] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _run_job(job):
+    index, k_ar, harmonics, folds, horizon = job
+    return index, score_candidate(_shared['values'], k_ar, harmonics, folds, horizon)
+
+
+def candidates(max_order, harmonics):
+    return [(k_ar, h) for h in harmonics for k_ar in range(1, max_order + 1)]
+
+
+def run_ensemble(values, candidate_list, folds=6, horizon=30, workers=None):
+    # Returns [(score, k_ar, harmonics)] sorted best first; ties keep candidate order,
+    # so the serial and parallel runs pick the same winner
+    jobs = [(index, k_ar, h, folds, horizon) for index, (k_ar, h) in enumerate(candidate_list)]
+    workers = os.cpu_count() if workers is None else workers
+    # Same memory layout in both modes, so the BLAS results are bit-identical
+    values = np.ascontiguousarray(values, dtype='float64')
+    if workers <= 1:
+        scores = {index: score_candidate(values, k_ar, h, folds, horizon)
+                  for index, k_ar, h, folds, horizon in jobs}
+    else:
+        block = shared_memory.SharedMemory(create=True, size=values.nbytes)
+        try:
+            np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                     initargs=(block.name, values.shape, values.dtype.str)) as pool:
+                scores = dict(pool.map(_run_job, jobs, chunksize=max(1, len(jobs) // (4 * workers))))
+        finally:
+            block.close()
+            block.unlink()
+    ranked = sorted(range(len(jobs)), key=lambda index: (scores[index], index))
+    return [(scores[index],) + tuple(candidate_list[index]) for index in ranked]
+
+
+def write_forecast(history, k_ar, harmonics, days, directory=DATA_DIR):
+    values = history[INDICATOR_COLUMNS].to_numpy(dtype='float64')
+    params = fit_candidate(values, k_ar, harmonics)
+    forecast = pd.DataFrame(forecast_candidate(params, values, k_ar, harmonics, days), columns=INDICATOR_COLUMNS)
+    forecast['PRECTOTCORR'] = forecast['PRECTOTCORR'].clip(lower=0)
+    forecast.insert(0, 'DATE', pd.date_range(history['DATE'].iloc[-1] + pd.Timedelta(days=1), periods=days))
+    path = os.path.join(directory, ENSEMBLE_FILE)
+    forecast.to_csv(path, index=False, date_format='%Y-%m-%d', float_format='%.4f')
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--site', default=DEFAULT_SITE_ID, help='site whose history is modelled')
+    parser.add_argument('--max-order', type=int, default=10)
+    parser.add_argument('--harmonics', type=int, nargs='+', default=[0, 1, 2, 3],
+                        help='annual Fourier harmonics per variant (0 = non-seasonal)')
+    parser.add_argument('--folds', type=int, default=6)
+    parser.add_argument('--horizon', type=int, default=30, help='days forecast per validation fold')
+    parser.add_argument('--workers', type=int, default=None, help='default: all cores; 1 = serial')
+    parser.add_argument('--forecast-days', type=int, default=730)
+    args = parser.parse_args()
+
+    site = get_site(args.site)
+    history = load_data(site.history_path)
+    values = history[INDICATOR_COLUMNS].to_numpy(dtype='float64')
+    ranking = run_ensemble(values, candidates(args.max_order, args.harmonics),
+                           folds=args.folds, horizon=args.horizon, workers=args.workers)
+
+    score, k_ar, harmonics = ranking[0]
+    path = write_forecast(history, k_ar, harmonics, args.forecast_days, site.directory)
+    with open(site.path(SUMMARY_FILE), 'w') as f:
+        json.dump({'k_ar': k_ar, 'harmonics': harmonics, 'score': score, 'folds': args.folds,
+                   'horizon': args.horizon,
+                   'ranking': [{'k_ar': k, 'harmonics': h, 'score': s} for s, k, h in ranking]}, f, indent=2)
+    for s, k, h in ranking[:5]:
+        print(f"VAR({k}) harmonics={h}: {s:.4f}")
+    print(f"Winner VAR({k_ar}) harmonics={harmonics}; forecast written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import gzip
+import io
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+
+# Download formats: label -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'CSV (gzip)': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+# Rows converted at a time, so no full-table CSV string is ever built
+CHUNK_ROWS = 10_000
+
+
+def write_csv(frame, stream, index=False, date_format=None, chunk_rows=CHUNK_ROWS):
+    # Encodes frame into a binary stream chunk by chunk
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='', write_through=True)
+    for start in range(0, max(len(frame), 1), chunk_rows):
+        frame.iloc[start:start + chunk_rows].to_csv(text, header=start == 0, index=index, date_format=date_format)
+    text.detach()
+
+
+def write_parquet(frame, stream, index=False, chunk_rows=CHUNK_ROWS):
+    import pyarrow as pa
+    from pyarrow import parquet
+
+    writer = None
+    for start in range(0, max(len(frame), 1), chunk_rows):
+        table = pa.Table.from_pandas(frame.iloc[start:start + chunk_rows], preserve_index=index)
+        if writer is None:
+            writer = parquet.ParquetWriter(stream, table.schema)
+        writer.write_table(table)
+    writer.close()
+
+
+def export_bytes(frame, fmt, index=False, date_format=None):
+    buffer = io.BytesIO()
+    if fmt == 'Parquet':
+        write_parquet(frame, buffer, index=index)
+    elif fmt == 'CSV (gzip)':
+        with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as compressed:
+            write_csv(frame, compressed, index=index, date_format=date_format)
+    else:
+        write_csv(frame, buffer, index=index, date_format=date_format)
+    return buffer.getvalue()
+
+
+# Generated downloads shared by every session, keyed by the source frame (the dataset
+# version: load_data, the forecaster and predict_batch all return a new frame when the
+# data changes), the requested range and the format. Least recently used entries are
+# evicted beyond max_bytes.
+class ExportCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+
+    def get(self, source, key, build):
+        full_key = (id(source),) + key
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None and entry[0] is source:
+                self._entries.move_to_end(full_key)
+                return entry[1]
+        data = build()
+        with self._lock:
+            previous = self._entries.pop(full_key, None)
+            if previous is not None:
+                self.total_bytes -= len(previous[1])
+            self._entries[full_key] = (source, data)
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+        return data
+
+
+export_cache = ExportCache()
+
+
+def download_button(source, key, frame, file_stem, index=False, date_format=None, widget_key='download'):
+    # Format picker plus a download button whose file is only generated when it is clicked
+    # (Streamlit runs the callable on demand) and then served from export_cache.
+    # `source` identifies the dataset version and `key` the range of it that `frame` holds.
+    fmt = st.radio("Format", list(EXPORT_FORMATS), horizontal=True, key=f'{widget_key}_format')
+    extension, mime = EXPORT_FORMATS[fmt]
+    st.download_button(label=f"Download {fmt}",
+                       data=lambda: export_cache.get(source, key + (fmt,),
+                                                     lambda: export_bytes(frame, fmt, index, date_format)),
+                       file_name=f'{file_stem}.{extension}', mime=mime, key=widget_key)
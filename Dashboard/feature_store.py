@@ -0,0 +1,27 @@
+import pandas as pd
+
+# Forecast indicators keyed by day. The table is indexed once by a sorted,
+# unique DatetimeIndex so that a whole date range is resolved with a single
+# vectorized index lookup instead of one boolean scan per selected day.
+class FeatureStore:
+    def __init__(self, df, date_column='DATE'):
+        dates = pd.DatetimeIndex(pd.to_datetime(df[date_column])).normalize()
+        frame = df.drop(columns=[date_column]).set_index(dates)
+        frame.index.name = date_column
+        # Keep the first row of a duplicated date, as the old `.iloc[0]` lookup did
+        frame = frame[~frame.index.duplicated(keep='first')].sort_index()
+        self.frame = frame
+
+    def __len__(self):
+        return len(self.frame)
+
+    def lookup(self, dates):
+        # Returns the rows found for `dates` (indexed by date, in request order)
+        # together with the list of requested dates that have no row
+        index = pd.DatetimeIndex(dates).normalize()
+        positions = self.frame.index.get_indexer(index)
+        found = positions >= 0
+        rows = self.frame.iloc[positions[found]]
+        rows.index = index[found]
+        missing = list(index[~found].date)
+        return rows, missing
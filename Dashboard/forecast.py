@@ -1,22 +1,38 @@
+import os
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+from web_function import load_data, INDICATOR_COLUMNS, INDICATOR_LABELS_ID
+from model_update import get_state_forecaster
+from chart_data import CHART_RESOLUTIONS
+from charts import combined_figure
+from exports import download_button
+from profiling import span
+from sites import DEFAULT_SITE
 
-def app():
+# Longest forecast horizon offered by the date picker
+MAX_HORIZON_DAYS = 3650
+
+def app(site=DEFAULT_SITE):
     # Judul Halaman
     st.title("Data Display")
 
-    # Load the CSV file
-    csv_path = 'Dashboard/data/2.csv'
-    df = pd.read_csv(csv_path, delimiter=';')
+    # Forecast of the model selected by Dashboard/ensemble.py, when it has been run for the site
+    model_options = ["VAR (AIC)"]
+    if os.path.exists(site.ensemble_path):
+        model_options.insert(0, "Ensemble (rolling-origin winner)")
+    model_choice = st.radio("Model Forecast", model_options, horizontal=True)
 
-    # Convert the DATE column to datetime format
-    df['DATE'] = pd.to_datetime(df['DATE'], format='%d/%m/%Y')  # Mengubah ke format datetime
-    df.set_index('DATE', inplace=True)
+    if model_choice == "VAR (AIC)":
+        # VAR model of the site's latest saved state (Dashboard/model_update.py), brought up to
+        # the end of the history; fitted once per server process when no state is saved yet
+        history = load_data(site.history_path)
+        with span('forecast.var_forecast'):
+            forecast_df = get_state_forecaster(history, site.directory).forecast(MAX_HORIZON_DAYS)
+    else:
+        forecast_df = load_data(site.ensemble_path, index_col='DATE')
 
-    # Define the date range for selection
-    min_date = pd.to_datetime("1/1/2024", format="%d/%m/%Y").date()
-    max_date = pd.to_datetime("31/12/2025", format="%d/%m/%Y").date()
+    # Define the date range for selection: the days covered by the forecast
+    min_date, max_date = forecast_df.index[0].date(), forecast_df.index[-1].date()
 
     # Pemfilteran Data Berdasarkan Range Waktu
     date_range = st.date_input("Pilih Rentang Waktu", [], min_value=min_date, max_value=max_date)
@@ -24,38 +40,34 @@ def app():
         st.error("Please select date range.")
         return
     start_date, end_date = date_range
-    filtered_df = df.loc[start_date:end_date]
+    start_ts, end_ts = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    filtered_df = forecast_df.loc[start_ts:end_ts].round(2).rename(columns=INDICATOR_LABELS_ID)
 
-    st.write(f"Menampilkan data hasil forecast dari {start_date} hingga {end_date}")
+    st.write(f"Menampilkan data hasil forecast {site.name} dari {start_date} hingga {end_date}")
 
     # Convert the date to the desired format (dd/mm/yyyy) for display
     filtered_df_display = filtered_df.copy()
     filtered_df_display.index = filtered_df_display.index.strftime('%d/%m/%Y')  # Format index DATE
 
-    # Display the data and plot for each column
+    # Points per chart; ranges shorter than the budget are always drawn at full daily detail
+    resolution = st.select_slider("Detail Grafik", options=list(CHART_RESOLUTIONS), value='1000')
+    max_points = CHART_RESOLUTIONS[resolution] or len(filtered_df)
+
+    # Display the data and a single figure with a row per column (shared date axis,
+    # downsampled from the cached forecast per range and resolution)
     st.subheader("CSV Data and Corresponding Plots")
-    for column in filtered_df.columns:
-        col1, col2 = st.columns(2)
-        
-        # Display the table
-        with col1:
-            st.write(f"**{column}**")
-            st.write(filtered_df_display[[column]])  # Display with formatted DATE
-        
-        # Display the plot
-        with col2:
-            st.write(f"**Plot for {column}**")
-            fig = px.line(filtered_df, x=filtered_df.index, y=column, title=f'Plot of {column}')
-            st.plotly_chart(fig)
-    
-    # Display the filtered dataframe after formatting date
-    st.write(filtered_df_display)
-
-    # Provide a download button for the data
-    csv_data = filtered_df.to_csv(index=True)
-    st.download_button(label="Download CSV", data=csv_data, file_name='filtered_data.csv', key='download_button')
-
-    st.write("Setelah melakukan forecasting curah hujan, nilai-nilai hasil forscast tersebut dapat dijadikan sebagai input untuk model prediksi yang lebih lanjut. Data forecasting ini mencakup estimasi (nama nama variable) di masa depan, yang diperoleh melalui metode analysis time series SVARMA dan VAR.")
+    st.write(filtered_df_display)  # Display with formatted DATE
+    with span('forecast.combined_figure'):
+        fig = combined_figure(forecast_df, INDICATOR_COLUMNS, [INDICATOR_LABELS_ID[column] for column in INDICATOR_COLUMNS],
+                              start_ts, end_ts, max_points, xaxis_title='DATE')
+    with span('forecast.plotly_chart'):  # Figure validation and JSON serialization
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Provide a download button for the data (generated only when requested, cached per forecast and range)
+    download_button(forecast_df, ('forecast', start_ts, end_ts), filtered_df, 'filtered_data', index=True,
+                    widget_key='download_button')
+
+    st.write("Setelah melakukan forecasting curah hujan, nilai-nilai hasil forscast tersebut dapat dijadikan sebagai input untuk model prediksi yang lebih lanjut. Data forecasting ini mencakup estimasi (nama nama variable) di masa depan, yang diperoleh melalui model time series VAR yang dilatih pada data historis 2017-2023.")
 
 if __name__ == "__main__":
     app()
@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from sites import MAX_ACTIVE_SITES
+from web_function import INDICATOR_COLUMNS
+
+# VAR forecasting engine for the climate indicators. The model is fitted once
+# on the historical table and its parameters are kept in memory; forecasts are
+# produced by the VAR recursion and extended from the last computed state when
+# a longer horizon is requested, so no request ever refits the model.
+class VarForecaster:
+    def __init__(self, intercept, coefs, last_date, last_observations):
+        self.intercept = np.asarray(intercept, dtype='float64')
+        self.coefs = np.asarray(coefs, dtype='float64')  # (k_ar, k, k), coefs[i] multiplies y[t-1-i]
+        self.k_ar = self.coefs.shape[0]
+        self.last_date = pd.Timestamp(last_date)
+        # Seed observations followed by every forecast computed so far
+        self._path = np.asarray(last_observations, dtype='float64')[-self.k_ar:]
+        self._frame = None  # Last frame returned by forecast(), reused for the same horizon
+        self._lock = threading.Lock()
+
+    @classmethod
+    def fit(cls, history, maxlags=15, ic='aic'):
+        # statsmodels is only imported when a model actually has to be fitted
+        from statsmodels.tsa.api import VAR
+
+        values = history[INDICATOR_COLUMNS].to_numpy(dtype='float64')
+        results = VAR(values).fit(maxlags=maxlags, ic=ic)
+        return cls(results.intercept, results.coefs, history['DATE'].iloc[-1], values[-results.k_ar:])
+
+    @property
+    def horizon(self):
+        # Number of days already forecast
+        return len(self._path) - self.k_ar
+
+    def _extend(self, steps):
+        # y[t] = c + A_1 y[t-1] + ... + A_p y[t-p], continued from the end of the path
+        stacked = np.hstack(list(self.coefs))  # (k, k * k_ar)
+        lags = self._path[::-1][:self.k_ar].reshape(-1)
+        new = np.empty((steps, len(self.intercept)))
+        for step in range(steps):
+            new[step] = self.intercept + stacked @ lags
+            lags = np.concatenate([new[step], lags[:-len(self.intercept)]])
+        self._path = np.vstack([self._path, new])
+
+    def forecast(self, horizon):
+        # Daily forecasts for the `horizon` days following the last observation.
+        # The frame is shared with other callers asking for the same horizon: treat it as read-only.
+        with self._lock:
+            if self._frame is not None and len(self._frame) == horizon:
+                return self._frame
+            if horizon > self.horizon:
+                self._extend(horizon - self.horizon)
+            values = self._path[self.k_ar:self.k_ar + horizon]
+            dates = pd.date_range(self.last_date + pd.Timedelta(days=1), periods=horizon, name='DATE')
+            forecast = pd.DataFrame(values, index=dates, columns=INDICATOR_COLUMNS)
+            # Rainfall cannot be negative
+            forecast['PRECTOTCORR'] = forecast['PRECTOTCORR'].clip(lower=0)
+            self._frame = forecast
+        return forecast
+
+    def forecast_range(self, start_date, end_date):
+        end_date = pd.Timestamp(end_date)
+        horizon = max((end_date - self.last_date).days, 0)
+        return self.forecast(horizon).loc[pd.Timestamp(start_date):end_date]
+
+
+# Fitted engines shared by every session, keyed by the history frame they were fitted on
+# (one per site). load_data returns the same frame object until the file changes, so a
+# changed file automatically leads to a refit. The least recently used engines are
+# dropped beyond MAX_ACTIVE_SITES.
+_forecasters = OrderedDict()
+_forecasters_lock = threading.Lock()
+
+def get_forecaster(history, maxlags=15, ic='aic'):
+    key = (id(history), maxlags, ic)
+    with _forecasters_lock:
+        entry = _forecasters.get(key)
+        if entry is not None and entry[0] is history:
+            _forecasters.move_to_end(key)
+            return entry[1]
+    # Fitted without the lock, so other sites' sessions are not blocked meanwhile; when two
+    # sessions fit the same history at once, the first engine stored is kept
+    forecaster = VarForecaster.fit(history, maxlags=maxlags, ic=ic)
+    with _forecasters_lock:
+        entry = _forecasters.get(key)
+        if entry is not None and entry[0] is history:
+            forecaster = entry[1]
+        else:
+            _forecasters[key] = (history, forecaster)
+        _forecasters.move_to_end(key)
+        while len(_forecasters) > MAX_ACTIVE_SITES:
+            _forecasters.popitem(last=False)
+    return forecaster
@@ -2,6 +2,18 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 from web_function import preprocess_dataframe, load_data  # Assuming these are your custom functions
+from chart_data import chart_series, DEFAULT_MAX_POINTS, CHART_RESOLUTIONS
+from charts import combined_figure
+from aggregates import get_cube
+from profiling import span, timed
+from sites import DEFAULT_SITE, DEFAULT_SITE_ID
+
+# Marker colour of each upwelling status in the rainfall chart
+STATUS_COLORS = {'BERPOTENSI UPWELLING': 'red', 'TIDAK BERPOTENSI UPWELLING': 'green'}
+
+# Historical table views: daily rows or one of the aggregate cube's periods
+VIEWS_ID = {'Harian': None, 'Mingguan': 'weekly', 'Bulanan': 'monthly', 'Musiman': 'seasonal'}
+VIEWS_EN = {'Daily': None, 'Weekly': 'weekly', 'Monthly': 'monthly', 'Seasonal': 'seasonal'}
 
 # Descriptive names for the climate indicators in both languages
 indicator_names_en = {
@@ -20,25 +32,25 @@ indicator_names_id = {
     'WS10M': 'Kecepatan Angin Rata-Rata pada Ketinggian 10 Meter (m/s)'
 }
 
-def plot_climate_indicator(df, indicator, lang):
+@timed
+def plot_climate_indicators(df, indicators, lang, start_date=None, end_date=None, max_points=DEFAULT_MAX_POINTS):
     # Select indicator name based on chosen language
     indicator_names = indicator_names_en if lang == "English" else indicator_names_id
 
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=df.index, y=df[indicator], mode='lines', name=indicator))
-    fig.update_layout(title=indicator_names[indicator],
-                      xaxis_title='Date' if lang == 'English' else 'Tanggal',
-                      yaxis_title=indicator_names[indicator],
-                      template='plotly_dark')
-    return fig
+    # One figure with a row per selected indicator on a shared date axis, downsampled to the
+    # chart's point budget (cached per indicators, range and resolution)
+    return combined_figure(df, indicators, [indicator_names[indicator] for indicator in indicators],
+                           start_date, end_date, max_points, date_column='DATE',
+                           xaxis_title='Date' if lang == 'English' else 'Tanggal')
 
-def app():
+def app(site=DEFAULT_SITE):
     # Set default language as "Bahasa Indonesia"
     lang = st.selectbox("Pilih Bahasa / Select Language", ["Bahasa Indonesia", "English"])
 
     if lang == "Bahasa Indonesia":
-        st.title("Dashboard Pemantauan dan Prediksi Upwelling Berbasis Indikator Iklim di Danau Laut Tawar")
-        st.markdown("""
+        st.title(f"Dashboard Pemantauan dan Prediksi Upwelling Berbasis Indikator Iklim di {site.name}")
+        if site.id == DEFAULT_SITE_ID:
+            st.markdown("""
             Selamat datang di Dashboard Pemantauan dan Prediksi Upwelling berbasis indikator iklim Danau Laut Tawar!
             Dengan menggabungkan data dalam setahun, potensi produksi ikan di Danau Laut Tawar dapat mencapai 196 ton. 
             Namun, perubahan iklim yang tidak menentu mengganggu kestabilan produksi ikan di Danau Laut Tawar.
@@ -55,8 +67,9 @@ def app():
         7. Status       : Potensi Kejadian Upwelling
         """
     else:
-        st.title("Climate Indicator-Based Upwelling Monitoring and Prediction Dashboard in Danau Laut Tawar")
-        st.markdown("""
+        st.title(f"Climate Indicator-Based Upwelling Monitoring and Prediction Dashboard in {site.name}")
+        if site.id == DEFAULT_SITE_ID:
+            st.markdown("""
             Welcome to the Lake Laut Tawar climate indicator-based Upwelling Monitoring and Prediction Dashboard!
             By combining the data in a year, the potential fish production in Danau Laut Tawar can reach 196 tons.
             However, erratic climate change is destabilizing fish production in Danau Laut Tawar.
@@ -73,31 +86,44 @@ def app():
         7. Status           : Potential Upwelling Event
         """
 
-    # Load Dataset
-    df = load_data("Dashboard/data/HASIL_CLUSTERING.csv")
-    df['DATE'] = pd.to_datetime(df['DATE'])
-    
-    # Create two separate dataframes for table and plotting
-    df_table = df.copy()
-    df_plot = df.copy()
-
-    # Convert date to string for display in table
-    df_table['DATE_STR'] = df_table['DATE'].dt.strftime('%d-%m-%Y')
-    df_table.set_index('DATE_STR', inplace=True)
+    # Load the site's dataset and its precomputed aggregates (range queries need no scan of the rows)
+    df = load_data(site.history_path)
+    cube = get_cube(site.history_path)
 
-    # Filter based on date range
-    min_date = pd.to_datetime("2017-01-01")
-    max_date = pd.to_datetime("2023-12-31")
+    # Filter based on date range: the days the site's history covers
+    min_date = pd.Timestamp(cube.dates[0])
+    max_date = pd.Timestamp(cube.dates[-1])
     date_range = st.date_input("Pilih Rentang Waktu" if lang == "Bahasa Indonesia" else "Select Date Range", 
                                [min_date, max_date], 
-                               min_value=min_date, max_value=max_date, key="date_range")
+                               min_value=min_date, max_value=max_date, key=f"date_range_{site.id}")
     
     start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-    df_table = df_table[(df_table['DATE'] >= start_date) & (df_table['DATE'] <= end_date)]
-    df_plot = df_plot[(df_plot['DATE'] >= start_date) & (df_plot['DATE'] <= end_date)]
-
-    # Display historical data
-    st.write(df_table[['ALLSKY_KT', 'T2M', 'PRECTOTCORR', 'PS', 'WS10M', 'Status']])
+    # Rows of the range, located by binary search on the sorted dates
+    lo, hi = cube.bounds(start_date, end_date)
+
+    # Points per chart; ranges shorter than the budget are always drawn at full daily detail
+    resolution = st.select_slider("Detail Grafik" if lang == "Bahasa Indonesia" else "Chart Detail",
+                                  options=list(CHART_RESOLUTIONS), value='1000')
+    max_points = CHART_RESOLUTIONS[resolution] or len(df)
+
+    # Upwelling days of the range from the cube's prefix counts
+    _, days, upwelling_days = cube.summary(start_date, end_date)
+    col1, col2 = st.columns(2)
+    col1.metric("Jumlah Hari" if lang == "Bahasa Indonesia" else "Days", days)
+    col2.metric("Hari Berpotensi Upwelling" if lang == "Bahasa Indonesia" else "Potential Upwelling Days",
+                upwelling_days)
+
+    # Display historical data, daily or aggregated per week, month or season
+    views = VIEWS_ID if lang == "Bahasa Indonesia" else VIEWS_EN
+    view = st.radio("Tampilan Data" if lang == "Bahasa Indonesia" else "Data View", list(views), horizontal=True)
+    if views[view] is None:
+        df_table = df.iloc[lo:hi]
+        df_table = df_table.set_index(df_table['DATE'].dt.strftime('%d-%m-%Y').rename('DATE_STR'))
+        st.write(df_table[['ALLSKY_KT', 'T2M', 'PRECTOTCORR', 'PS', 'WS10M', 'Status']])
+    else:
+        df_table = cube.table(views[view], start_date, end_date).round(2)
+        df_table.index = df_table.index.strftime('%d-%m-%Y')
+        st.write(df_table)
 
     # Column descriptions
     st.header(column_header)
@@ -107,9 +133,11 @@ def app():
     st.header(tampilan_header)
     fig = go.Figure()
 
-    for status, color in zip(df_plot['Status'].unique(), ['red', 'green']):
-        filtered_df = df_plot[df_plot['Status'] == status]
-        fig.add_trace(go.Scatter(x=filtered_df['DATE'], y=filtered_df['PRECTOTCORR'],
+    for status, color in STATUS_COLORS.items():
+        # Min/max per bucket keeps every rainfall peak of the status
+        dates, values = chart_series(df, 'PRECTOTCORR', start_date, end_date, max_points, method='minmax',
+                                     date_column='DATE', where=('Status', status))
+        fig.add_trace(go.Scatter(x=dates, y=values,
                                  mode='markers', marker=dict(color=color), name=status))
 
     fig.update_layout(title='Potential Upwelling vs Non-Upwelling Events' if lang == "English" 
@@ -117,7 +145,8 @@ def app():
                       xaxis_title='Date' if lang == "English" else 'Tanggal',
                       yaxis_title='Rainfall (PRECTOTCORR)' if lang == "English" else 'Curah Hujan (PRECTOTCORR)',
                       template='plotly_dark')
-    st.plotly_chart(fig, use_container_width=True)
+    with span('home.plotly_chart'):  # Figure validation and JSON serialization
+        st.plotly_chart(fig, use_container_width=True)
 
     # Climate Indicator Selection
     st.header("Select Climate Indicators" if lang == "English" else "Pilih Indikator Iklim")
@@ -132,31 +161,31 @@ def app():
         ps = st.checkbox('PS' if lang == "English" else 'PS - Tekanan Permukaan', value=select_all)
         ws10m = st.checkbox('WS10M' if lang == "English" else 'WS10M - Kecepatan Angin', value=select_all)
 
-    # Plot selected indicators
+    # Plot selected indicators (with their descriptions) in a single figure
+    selected_indicators = []
     if allsky_kt:
-        fig_indicator = plot_climate_indicator(df_plot, 'ALLSKY_KT', lang)
-        st.plotly_chart(fig_indicator, use_container_width=True)
-        st.markdown('This graph displays the sky clarity index values from 2017 to 2024. This index measures how clear or bright the sky is, with values ranging from 0.1 (very cloudy) to 0.7 (very bright). Changes in this index show daily variations in sky clarity, which can be affected by factors such as clouds or pollution.' if lang == "English" else 'Grafik ini menampilkan nilai indeks kejernihan langit dari 2017 hingga 2024. Indeks ini mengukur seberapa jernih atau cerah langit, dengan nilai berkisar antara 0,1 (sangat keruh) hingga 0,7 (sangat cerah). Perubahan indeks ini menunjukkan variasi harian dalam kejernihan langit, yang bisa dipengaruhi oleh faktor-faktor seperti awan atau polusi.')
+        selected_indicators.append(('ALLSKY_KT', 'This graph displays the sky clarity index values from 2017 to 2024. This index measures how clear or bright the sky is, with values ranging from 0.1 (very cloudy) to 0.7 (very bright). Changes in this index show daily variations in sky clarity, which can be affected by factors such as clouds or pollution.' if lang == "English" else 'Grafik ini menampilkan nilai indeks kejernihan langit dari 2017 hingga 2024. Indeks ini mengukur seberapa jernih atau cerah langit, dengan nilai berkisar antara 0,1 (sangat keruh) hingga 0,7 (sangat cerah). Perubahan indeks ini menunjukkan variasi harian dalam kejernihan langit, yang bisa dipengaruhi oleh faktor-faktor seperti awan atau polusi.'))
 
     if t2m:
-        fig_indicator = plot_climate_indicator(df_plot, 'T2M', lang)
-        st.plotly_chart(fig_indicator, use_container_width=True)
-        st.markdown('This graph illustrates the change in average air temperature at 2 meters above ground level, over the period 2017 to 2024. Temperatures range from 17°C to 22°C. The graph shows a typical seasonal pattern, with regular increases and decreases in temperature over time.' if lang == "English" else 'Grafik ini menggambarkan perubahan suhu rata-rata udara di ketinggian 2 meter dari permukaan tanah, selama periode 2017 hingga 2024. Suhu berkisar antara 17°C hingga 22°C. Grafik ini menunjukkan pola musiman yang khas, dengan kenaikan dan penurunan suhu yang teratur seiring berjalannya waktu.')
+        selected_indicators.append(('T2M', 'This graph illustrates the change in average air temperature at 2 meters above ground level, over the period 2017 to 2024. Temperatures range from 17°C to 22°C. The graph shows a typical seasonal pattern, with regular increases and decreases in temperature over time.' if lang == "English" else 'Grafik ini menggambarkan perubahan suhu rata-rata udara di ketinggian 2 meter dari permukaan tanah, selama periode 2017 hingga 2024. Suhu berkisar antara 17°C hingga 22°C. Grafik ini menunjukkan pola musiman yang khas, dengan kenaikan dan penurunan suhu yang teratur seiring berjalannya waktu.'))
 
     if prectotcorr:
-        fig_indicator = plot_climate_indicator(df_plot, 'PRECTOTCORR', lang)
-        st.plotly_chart(fig_indicator, use_container_width=True)
-        st.markdown('This graph shows the changes in rainfall amounts from 2017 to 2024. Rainfall amounts are measured in millimeters (mm), with considerable variation each year. Some periods show high rainfall, particularly at the end of the data in 2024, which may signal heavy rainfall events or an intense rainy season.' if lang == "English" else 'Grafik ini menunjukkan perubahan jumlah curah hujan dari tahun 2017 hingga 2024. Jumlah curah hujan diukur dalam milimeter (mm), dengan variasi yang cukup besar setiap tahunnya. Beberapa periode menunjukkan curah hujan yang tinggi, khususnya pada akhir data di tahun 2024, yang mungkin menandakan kejadian hujan lebat atau musim hujan intens.')
+        selected_indicators.append(('PRECTOTCORR', 'This graph shows the changes in rainfall amounts from 2017 to 2024. Rainfall amounts are measured in millimeters (mm), with considerable variation each year. Some periods show high rainfall, particularly at the end of the data in 2024, which may signal heavy rainfall events or an intense rainy season.' if lang == "English" else 'Grafik ini menunjukkan perubahan jumlah curah hujan dari tahun 2017 hingga 2024. Jumlah curah hujan diukur dalam milimeter (mm), dengan variasi yang cukup besar setiap tahunnya. Beberapa periode menunjukkan curah hujan yang tinggi, khususnya pada akhir data di tahun 2024, yang mungkin menandakan kejadian hujan lebat atau musim hujan intens.'))
 
     if ps:
-        fig_indicator = plot_climate_indicator(df_plot, 'PS', lang)
-        st.plotly_chart(fig_indicator, use_container_width=True)
-        st.markdown('This graph shows the average surface atmospheric pressure measured in kilopascals (kPa), from 2017 to 2024. The atmospheric pressure ranges from 87.6 to 88.2 kPa. The changes seen indicate variations in atmospheric pressure, which can be influenced by changes in weather or air pressure systems.' if lang == "English" else 'Grafik ini menunjukkan tekanan atmosfer permukaan rata-rata yang diukur dalam kilopascal (kPa), dari tahun 2017 hingga 2024. Tekanan atmosfer berkisar antara 87,6 hingga 88,2 kPa. Perubahan yang terlihat menunjukkan adanya variasi tekanan atmosfer, yang dapat dipengaruhi oleh perubahan cuaca atau sistem tekanan udara.')
+        selected_indicators.append(('PS', 'This graph shows the average surface atmospheric pressure measured in kilopascals (kPa), from 2017 to 2024. The atmospheric pressure ranges from 87.6 to 88.2 kPa. The changes seen indicate variations in atmospheric pressure, which can be influenced by changes in weather or air pressure systems.' if lang == "English" else 'Grafik ini menunjukkan tekanan atmosfer permukaan rata-rata yang diukur dalam kilopascal (kPa), dari tahun 2017 hingga 2024. Tekanan atmosfer berkisar antara 87,6 hingga 88,2 kPa. Perubahan yang terlihat menunjukkan adanya variasi tekanan atmosfer, yang dapat dipengaruhi oleh perubahan cuaca atau sistem tekanan udara.'))
 
     if ws10m:
-        fig_indicator = plot_climate_indicator(df_plot, 'WS10M', lang)
-        st.plotly_chart(fig_indicator, use_container_width=True)
-        st.markdown('This graph shows the change in average wind speed at a height of 10 meters from the ground, from 2017 to 2024. Wind speeds range from 0.5 meters per second to 2.5 meters per second. The fluctuations in this graph show variations in wind speed, with some periods recording higher wind speeds.' if lang == "English" else 'Grafik ini memperlihatkan perubahan kecepatan angin rata-rata pada ketinggian 10 meter dari permukaan tanah, dari 2017 hingga 2024. Kecepatan angin berkisar antara 0,5 meter per detik hingga 2,5 meter per detik. Fluktuasi dalam grafik ini menunjukkan variasi dalam kecepatan angin, dengan beberapa periode yang mencatat kecepatan angin yang lebih tinggi.', unsafe_allow_html=True)
+        selected_indicators.append(('WS10M', 'This graph shows the change in average wind speed at a height of 10 meters from the ground, from 2017 to 2024. Wind speeds range from 0.5 meters per second to 2.5 meters per second. The fluctuations in this graph show variations in wind speed, with some periods recording higher wind speeds.' if lang == "English" else 'Grafik ini memperlihatkan perubahan kecepatan angin rata-rata pada ketinggian 10 meter dari permukaan tanah, dari 2017 hingga 2024. Kecepatan angin berkisar antara 0,5 meter per detik hingga 2,5 meter per detik. Fluktuasi dalam grafik ini menunjukkan variasi dalam kecepatan angin, dengan beberapa periode yang mencatat kecepatan angin yang lebih tinggi.'))
+
+    if selected_indicators:
+        fig_indicators = plot_climate_indicators(df, [indicator for indicator, _ in selected_indicators], lang,
+                                                 start_date, end_date, max_points)
+        with span('home.plotly_chart'):
+            st.plotly_chart(fig_indicators, use_container_width=True)
+        indicator_names = indicator_names_en if lang == "English" else indicator_names_id
+        for indicator, description in selected_indicators:
+            st.markdown(f"**{indicator_names[indicator]}**: {description}")
 
 if __name__ == "__main__":
     app()
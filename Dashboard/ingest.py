@@ -0,0 +1,74 @@
+"""Convert the dashboard's CSV datasets into typed, memory-mappable Feather files.
+
+Run from the repository root after any of the CSV files changes::
+
+    python Dashboard/ingest.py
+
+load_data() picks up a Feather file as soon as it is newer than its CSV and
+falls back to parsing the CSV otherwise (or when pyarrow is not installed).
+Datasets with a Status column also get their aggregate cube (weekly, monthly
+and seasonal statistics, see aggregates.py) written as .aggregates.npz; the
+forecast tables get the classifier's calibrated upwelling probability of
+every day (see probabilities.py) written as .probabilities.npz.
+
+Without arguments every dataset of every site (see sites.py) is converted;
+--site restricts this to the given sites, and explicit files are taken to
+belong to the first --site (the default site when none is given).
+"""
+import argparse
+import os
+
+import pandas as pd
+
+from sites import DEFAULT_SITE, get_site, list_sites
+from web_function import DATASETS, MODEL_FEATURES, columnar_path, normalize_dataset
+
+
+def ingest_dataset(file_path, site=DEFAULT_SITE):
+    spec = DATASETS[os.path.basename(file_path)]
+    df = normalize_dataset(pd.read_csv(file_path, delimiter=spec['delimiter']), spec)
+
+    # Uncompressed so that readers can memory-map the columns directly
+    from pyarrow import feather
+    target = columnar_path(file_path)
+    feather.write_feather(df, target, compression='uncompressed')
+    targets = [target]
+
+    if 'Status' in df.columns:
+        from aggregates import AggregateCube, aggregates_path
+        target = aggregates_path(file_path)
+        AggregateCube.from_history(df).save(target)
+        targets.append(target)
+    else:
+        # Forecast tables: probabilities for every day, tagged with the model they come from
+        import model_registry
+        from probabilities import get_calibration, probabilities_path, save_probabilities, upwelling_probability
+        entry = model_registry.get_entry(site.model_path)
+        calibration = get_calibration(entry.model, entry.sha256, site.history_path)
+        probability, margin = upwelling_probability(entry.model, calibration, df[MODEL_FEATURES])
+        target = probabilities_path(file_path)
+        save_probabilities(target, df['DATE'].to_numpy(), probability, margin, calibration)
+        targets.append(target)
+    return targets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='*',
+                        help='CSV files to convert (default: every known dataset of the selected sites)')
+    parser.add_argument('--site', action='append', default=None, help='site id (repeatable, default: all sites)')
+    args = parser.parse_args()
+
+    sites = [get_site(site_id) for site_id in args.site] if args.site else list(list_sites().values())
+    if args.files:
+        jobs = [(file_path, sites[0] if args.site else DEFAULT_SITE) for file_path in args.files]
+    else:
+        jobs = [(site.path(name), site) for site in sites for name in DATASETS
+                if os.path.exists(site.path(name))]
+    for file_path, site in jobs:
+        targets = ingest_dataset(file_path, site)
+        print(f"[{site.id}] {file_path} -> {', '.join(targets)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,19 @@
 import streamlit as st
 from streamlit_option_menu import option_menu
-from web_function import preprocess_dataframe, load_data
-import home
-import forecast
-import predict
-import about
+import profiling
+from page_loader import load_page, import_times
+from sites import DEFAULT_SITE_ID, list_sites
 
 class MultiApp:
     def __init__(self):
         self.apps = []
 
-    def add_app(self, title, func):
+    def add_app(self, title, module, icon):
+        # module is imported (by name) only when the page is first selected
         self.apps.append({
             "title": title,
-            "function": func
+            "module": module,
+            "icon": icon
         })
 
     def run(self):
@@ -25,8 +25,8 @@ class MultiApp:
             # Option menu
             app = option_menu(
                 menu_title='Dashboard',
-                options=['Home', 'Forecast', 'Prediction', 'About'],
-                icons=['house-fill', 'cloud-lightning-rain-fill', 'bi-water', 'info-circle-fill'],
+                options=[page['title'] for page in self.apps],
+                icons=[page['icon'] for page in self.apps],
                 menu_icon='bi-cast',
                 default_index=0,
                 styles={
@@ -37,21 +37,51 @@ class MultiApp:
                     "nav-link-selected": {"background-color": "#02ab21"},
                 }
             )
+            # Monitored lake or reservoir; every page shows the data of this site
+            sites = list_sites()
+            site_id = DEFAULT_SITE_ID
+            if len(sites) > 1:
+                site_id = st.selectbox('Lokasi / Site', list(sites), format_func=lambda key: sites[key].name,
+                                       key='site')
+            site = sites.get(site_id, sites[DEFAULT_SITE_ID])
+
             st.write('Created By:')
             st.image('usk.png')
                 
             st.image('WhatsApp Image 2024-09-12 at 20.52.51_023c9d4d.png', use_column_width=True)
 
         # Main content
-        if app == "Home":
-            home.app()
-        elif app == "Forecast":
-            forecast.app()
-        elif app == "Prediction":
-            predict.app()
-        elif app == 'About':
-            about.app()
+        page = next(page for page in self.apps if page['title'] == app)
+        run = profiling.begin_run()
+        with profiling.span(f"page.{page['module']}"):
+            load_page(page['module']).app(site)
+
+        # Developer panels, shown when the server runs with DASHBOARD_PROFILE set
+        if profiling.enabled:
+            # Import time of every page module loaded by this server process so far
+            with st.sidebar.expander('Page import times'):
+                for module, seconds in import_times().items():
+                    st.write(f"{module}: {seconds * 1000:.0f} ms")
+            self.profiler_panel(run)
+
+    def profiler_panel(self, run):
+        with st.sidebar.expander('Profiler'):
+            st.write('This run')
+            st.dataframe(profiling.summary(run), hide_index=True)
+            st.write(f"All recorded runs (last {profiling.RING_SIZE} records)")
+            st.dataframe(profiling.summary(), hide_index=True)
+            # The JSON is only built when the button is clicked
+            st.download_button('Export JSON', data=profiling.export_json, file_name='profile.json',
+                               mime='application/json')
+            if st.button('Clear records'):
+                profiling.clear()
+                # Rerun so the tables above no longer show the cleared records
+                st.rerun()
 
 # Create an instance of MultiApp and run it
 multi_app = MultiApp()
+multi_app.add_app('Home', 'home', 'house-fill')
+multi_app.add_app('Forecast', 'forecast', 'cloud-lightning-rain-fill')
+multi_app.add_app('Prediction', 'predict', 'bi-water')
+multi_app.add_app('About', 'about', 'info-circle-fill')
 multi_app.run()
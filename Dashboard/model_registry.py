@@ -0,0 +1,135 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from profiling import timed
+from sites import MAX_ACTIVE_SITES
+
+# Process-wide registry of loaded model artifacts. Streamlit reruns the page
+# script on every interaction, but this module is imported once per server
+# process, so every session shares the entries stored here. Sites without a
+# classifier of their own share the default one; beyond MAX_ACTIVE_SITES models
+# the least recently used is dropped.
+_models = OrderedDict()
+_lock = threading.Lock()
+
+
+class ModelEntry:
+    def __init__(self, path, model, mtime_ns, size, sha256, load_seconds, footprint_bytes):
+        self.path = path
+        self.model = model
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.sha256 = sha256
+        self.load_seconds = load_seconds  # Wall time of the last joblib.load
+        self.footprint_bytes = footprint_bytes  # Approximate in-memory size of the loaded model
+        self.loads = 1
+
+    @property
+    def runtime(self):
+        return 'numpy' if type(self.model).__name__ == 'CompiledSVM' else 'joblib'
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'sha256': self.sha256,
+            'size_bytes': self.size,
+            'load_seconds': self.load_seconds,
+            'footprint_bytes': self.footprint_bytes,
+            'loads': self.loads,
+            'runtime': self.runtime,
+        }
+
+
+@timed
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _footprint(obj, seen=None):
+    # Approximate size of a fitted estimator: its attribute arrays plus the
+    # Python objects holding them (numpy arrays report their buffer via nbytes)
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = getattr(obj, 'nbytes', None)
+    if isinstance(size, int):
+        return size + sys.getsizeof(obj)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_footprint(k, seen) + _footprint(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_footprint(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += _footprint(vars(obj), seen)
+    return size
+
+
+@timed
+def _load(path, sha256):
+    # An SVM exported by svm_runtime.py from exactly this pickle (same sha256) is
+    # loaded with NumPy alone; otherwise the pickle is unpickled with joblib
+    start = time.perf_counter()
+    from svm_runtime import CompiledSVM, compiled_path
+    compiled = compiled_path(path)
+    model = None
+    if os.path.exists(compiled):
+        model = CompiledSVM.load(compiled)
+        if model.source_sha256 != sha256:
+            model = None
+    if model is None:
+        import joblib
+        model = joblib.load(path)
+    elapsed = time.perf_counter() - start
+    return model, elapsed, _footprint(model)
+
+
+def get_entry(path):
+    # A cheap os.stat is done on every call; the file is only hashed when its
+    # mtime or size changed, and only reloaded when the hash differs as well.
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    with _lock:
+        entry = _models.get(key)
+        if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+            _models.move_to_end(key)
+            return entry
+
+        sha256 = file_sha256(path)
+        if entry is not None and entry.sha256 == sha256:
+            entry.mtime_ns, entry.size = stat.st_mtime_ns, stat.st_size
+            _models.move_to_end(key)
+            return entry
+
+        model, elapsed, footprint_bytes = _load(path, sha256)
+        loads = entry.loads + 1 if entry is not None else 1
+        entry = ModelEntry(key, model, stat.st_mtime_ns, stat.st_size, sha256, elapsed, footprint_bytes)
+        entry.loads = loads
+        _models[key] = entry
+        _models.move_to_end(key)
+        while len(_models) > MAX_ACTIVE_SITES:
+            _models.popitem(last=False)
+        return entry
+
+
+def get_model(path):
+    return get_entry(path).model
+
+
+def model_stats():
+    # Load time and memory footprint for every model loaded in this process
+    with _lock:
+        return [entry.stats() for entry in _models.values()]
+
+
+def clear():
+    with _lock:
+        _models.clear()
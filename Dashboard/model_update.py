@@ -0,0 +1,300 @@
+"""Incrementally update the forecast model state with newly observed days.
+
+Run from the repository root with a CSV of new daily observations
+(DATE plus the ALLSKY_KT, T2M, PRECTOTCORR, PS and WS10M columns)::
+
+    python Dashboard/model_update.py new_days.csv --site laut-tawar
+
+The days after the end of the site's history must follow it without gaps.
+They are appended to the history as a part file (the same way power_ingest.py
+appends NASA POWER exports, with Status from the k-means clusters), and the
+latest versioned state in the site's directory is updated with them (or built
+from the history the first time) and written as the next model_state_vNNNN.npz;
+nothing is written when no new day was added. The Forecast page builds its VAR
+forecaster from the latest state, and the Prediction page flags inputs outside
+the range of the indicators the state has seen.
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import forecasting
+from forecasting import VarForecaster
+from sites import DATA_DIR, DEFAULT_SITE_ID, MAX_ACTIVE_SITES, get_site
+from web_function import INDICATOR_COLUMNS, load_data
+
+STATE_PATTERN = 'model_state_v{version:04d}.npz'
+
+
+def lagged_regressors(values, k_ar):
+    # Regressor rows [1, y[t-1], ..., y[t-p]] and targets y[t] for every t with a full set of lags
+    n = len(values) - k_ar
+    lags = [values[k_ar - lag:k_ar - lag + n] for lag in range(1, k_ar + 1)]
+    regressors = np.hstack([np.ones((n, 1))] + lags)
+    return regressors, values[k_ar:]
+
+
+# Sufficient statistics of the VAR least-squares fit for a fixed lag order:
+# Z'Z and Z'Y over all observations so far, plus the last k_ar observations
+# needed to form the lags of the next day. Appending m days costs
+# O(m * (k * k_ar)^2), independent of the length of the history.
+class VarState:
+    def __init__(self, k_ar, zz, zy, tail, last_date, nobs):
+        self.k_ar = k_ar
+        self.zz = zz
+        self.zy = zy
+        self.tail = tail
+        self.last_date = pd.Timestamp(last_date)
+        self.nobs = nobs
+
+    @classmethod
+    def from_history(cls, history, k_ar):
+        values = history[INDICATOR_COLUMNS].to_numpy(dtype='float64')
+        regressors, targets = lagged_regressors(values, k_ar)
+        return cls(k_ar, regressors.T @ regressors, regressors.T @ targets,
+                   values[-k_ar:], history['DATE'].iloc[-1], len(targets))
+
+    def update(self, new_rows):
+        # new_rows must continue the daily series; days already covered are skipped
+        new_rows = new_rows[new_rows['DATE'] > self.last_date].sort_values('DATE')
+        if new_rows.empty:
+            return 0
+        expected = pd.date_range(self.last_date + pd.Timedelta(days=1), periods=len(new_rows))
+        if not (pd.DatetimeIndex(new_rows['DATE']) == expected).all():
+            raise ValueError(f"New observations must follow {self.last_date.date()} without gaps")
+
+        values = np.vstack([self.tail, new_rows[INDICATOR_COLUMNS].to_numpy(dtype='float64')])
+        regressors, targets = lagged_regressors(values, self.k_ar)
+        self.zz = self.zz + regressors.T @ regressors
+        self.zy = self.zy + regressors.T @ targets
+        self.tail = values[-self.k_ar:]
+        self.last_date = pd.Timestamp(new_rows['DATE'].iloc[-1])
+        self.nobs += len(targets)
+        return len(targets)
+
+    def params(self):
+        # Same layout as statsmodels' VARResults.params: intercept row, then lag 1..p blocks
+        return np.linalg.solve(self.zz, self.zy)
+
+    def forecaster(self):
+        params = self.params()
+        k = params.shape[1]
+        coefs = params[1:].reshape(self.k_ar, k, k).transpose(0, 2, 1)
+        return VarForecaster(params[0], coefs, self.last_date, self.tail)
+
+
+# Running count, mean, variance (Chan et al. parallel update), min and max of the
+# classifier's input indicators, merged in O(new rows) per update
+class FeatureStats:
+    def __init__(self, count, mean, m2, minimum, maximum):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def from_frame(cls, df):
+        values = df[INDICATOR_COLUMNS].to_numpy(dtype='float64')
+        mean = values.mean(axis=0)
+        return cls(len(values), mean, ((values - mean) ** 2).sum(axis=0), values.min(axis=0), values.max(axis=0))
+
+    def update(self, df):
+        if df.empty:
+            return
+        other = FeatureStats.from_frame(df)
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+        self.count = count
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / max(self.count - 1, 1))
+
+    def outside(self, values):
+        # True for every row (INDICATOR_COLUMNS order) with an indicator outside the range seen so far
+        values = np.asarray(values, dtype='float64')
+        return ((values < self.minimum) | (values > self.maximum)).any(axis=1)
+
+
+def state_versions(directory=DATA_DIR):
+    versions = []
+    for path in glob.glob(os.path.join(directory, 'model_state_v*.npz')):
+        match = re.search(r'model_state_v(\d+)\.npz$', path)
+        if match:
+            versions.append(int(match.group(1)))
+    return sorted(versions)
+
+
+def save_state(var_state, feature_stats, directory=DATA_DIR):
+    # Artifacts are never overwritten: every update writes the next version
+    versions = state_versions(directory)
+    version = versions[-1] + 1 if versions else 1
+    path = os.path.join(directory, STATE_PATTERN.format(version=version))
+    np.savez(path, k_ar=var_state.k_ar, zz=var_state.zz, zy=var_state.zy, tail=var_state.tail,
+             last_date=var_state.last_date.value, nobs=var_state.nobs,
+             count=feature_stats.count, mean=feature_stats.mean, m2=feature_stats.m2,
+             minimum=feature_stats.minimum, maximum=feature_stats.maximum)
+    return path
+
+
+def load_state(path):
+    with np.load(path) as data:
+        var_state = VarState(int(data['k_ar']), data['zz'], data['zy'], data['tail'],
+                             pd.Timestamp(int(data['last_date'])), int(data['nobs']))
+        feature_stats = FeatureStats(int(data['count']), data['mean'], data['m2'],
+                                     data['minimum'], data['maximum'])
+    return var_state, feature_stats
+
+
+def load_latest_state(directory=DATA_DIR):
+    versions = state_versions(directory)
+    if not versions:
+        return None
+    return load_state(os.path.join(directory, STATE_PATTERN.format(version=versions[-1])))
+
+
+def initial_state(history, k_ar=None):
+    # Full fit on the historical table; the lag order is selected by AIC unless given
+    if k_ar is None:
+        k_ar = VarForecaster.fit(history).k_ar
+    return VarState.from_history(history, k_ar), FeatureStats.from_frame(history)
+
+
+def update_site_state(site, directory=None):
+    # Brings the site's latest state up to the end of its history (parts included) and
+    # saves it as the next version; returns the path written, or None when no day was added
+    directory = directory or site.directory
+    history = load_data(site.history_path)
+    latest = load_latest_state(directory)
+    if latest is None:
+        var_state, feature_stats = initial_state(history)
+    else:
+        var_state, feature_stats = latest
+        new_rows = history[history['DATE'] > var_state.last_date]
+        if var_state.update(new_rows) == 0:
+            return None
+        feature_stats.update(new_rows)
+    return save_state(var_state, feature_stats, directory)
+
+
+# Indicator statistics of the latest saved state, one per site directory, reloaded when a
+# new version is written; the least recently used sites' are dropped beyond MAX_ACTIVE_SITES
+_feature_stats = OrderedDict()
+_feature_stats_lock = threading.Lock()
+
+def get_feature_stats(directory):
+    # FeatureStats of the latest state, or None when no state is saved for the directory
+    versions = state_versions(directory)
+    if not versions:
+        return None
+    with _feature_stats_lock:
+        entry = _feature_stats.get(directory)
+        if entry is not None and entry[0] == versions[-1]:
+            _feature_stats.move_to_end(directory)
+            return entry[1]
+    _, feature_stats = load_state(os.path.join(directory, STATE_PATTERN.format(version=versions[-1])))
+    with _feature_stats_lock:
+        _feature_stats[directory] = (versions[-1], feature_stats)
+        _feature_stats.move_to_end(directory)
+        while len(_feature_stats) > MAX_ACTIVE_SITES:
+            _feature_stats.popitem(last=False)
+    return feature_stats
+
+
+# Forecasters built from the latest saved state, one per site directory, keyed by the
+# state version and the history frame they were checked against. Building one solves
+# the normal equations instead of refitting statsmodels; the least recently used sites'
+# are dropped beyond MAX_ACTIVE_SITES.
+_forecasters = OrderedDict()
+_forecasters_lock = threading.Lock()
+
+def get_state_forecaster(history, directory):
+    versions = state_versions(directory)
+    if not versions:
+        # No state saved for the site yet: full fit on the history
+        return forecasting.get_forecaster(history)
+    with _forecasters_lock:
+        entry = _forecasters.get(directory)
+        if entry is not None and entry[0] == versions[-1] and entry[1] is history:
+            _forecasters.move_to_end(directory)
+            return entry[2]
+    var_state, _ = load_state(os.path.join(directory, STATE_PATTERN.format(version=versions[-1])))
+    try:
+        # Days appended to the history since the state was saved are added in memory
+        var_state.update(history[history['DATE'] > var_state.last_date])
+    except ValueError:
+        return forecasting.get_forecaster(history)
+    if var_state.last_date != history['DATE'].iloc[-1]:
+        # The state runs past the history (e.g. appended parts were removed)
+        return forecasting.get_forecaster(history)
+    forecaster = var_state.forecaster()
+    with _forecasters_lock:
+        _forecasters[directory] = (versions[-1], history, forecaster)
+        _forecasters.move_to_end(directory)
+        while len(_forecasters) > MAX_ACTIVE_SITES:
+            _forecasters.popitem(last=False)
+    return forecaster
+
+
+def main():
+    from power_ingest import PartStore, append_days, gaps
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('new_rows', help='CSV file with the newly observed days')
+    parser.add_argument('--site', default=DEFAULT_SITE_ID, help='site whose history and state are updated')
+    parser.add_argument('--date-format', default=None, help='strftime format of the DATE column')
+    parser.add_argument('--directory', default=None, help="where the versioned states are kept "
+                                                          "(default: the site's directory)")
+    args = parser.parse_args()
+
+    site = get_site(args.site)
+    directory = args.directory or site.directory
+    new_rows = pd.read_csv(args.new_rows)
+    missing = [column for column in ['DATE'] + INDICATOR_COLUMNS if column not in new_rows.columns]
+    if missing:
+        sys.exit(f"{args.new_rows}: missing column(s) {', '.join(missing)}")
+    new_rows['DATE'] = pd.to_datetime(new_rows['DATE'], format=args.date_format).astype('datetime64[ns]')
+    new_rows = new_rows[['DATE'] + INDICATOR_COLUMNS].drop_duplicates('DATE', keep='last')
+    new_rows = new_rows.sort_values('DATE', ignore_index=True)
+
+    # Only days after the end of the history are taken, and they must continue it daily
+    store = PartStore(site.history_path)
+    last = store.last_row()['DATE']
+    new_rows = new_rows[new_rows['DATE'] > last]
+    breaks = gaps(pd.concat([pd.Series([last]), new_rows['DATE']]))
+    if breaks:
+        before, after = breaks[0]
+        sys.exit(f"{args.new_rows}: the new days must follow {before.date()} without gaps (next day given: {after.date()})")
+    if new_rows[INDICATOR_COLUMNS].isna().any().any():
+        sys.exit(f"{args.new_rows}: every new day needs all of {', '.join(INDICATOR_COLUMNS)}")
+
+    try:
+        if new_rows.empty:
+            # No day to append; a missing state is still built from the history
+            path = update_site_state(site, directory) if not state_versions(directory) else None
+        else:
+            new_rows[INDICATOR_COLUMNS] = new_rows[INDICATOR_COLUMNS].astype('float32')
+            path = append_days(site, store, new_rows, state_directory=directory)
+    except ValueError as e:
+        # The saved state does not continue the history (VarState.update)
+        sys.exit(f"[{site.id}] {e}")
+    if path is None:
+        print(f"[{site.id}] No day after {last.date()}; {directory} is unchanged")
+    else:
+        print(f"[{site.id}] Added {len(new_rows)} day(s) after {last.date()}; wrote {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import importlib
+import sys
+import threading
+import time
+
+# Page modules are imported on first use rather than when main.py starts, so a
+# page only pays for its own dependencies. Streamlit re-executes main.py on every
+# rerun but keeps sys.modules (and this module) for the life of the server
+# process, so every page is imported once and its import time is kept here.
+_import_seconds = {}
+_lock = threading.Lock()
+
+
+def load_page(module_name):
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    with _lock:
+        if module_name in sys.modules:
+            return sys.modules[module_name]
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        # Includes every dependency imported for the first time by this page
+        _import_seconds[module_name] = time.perf_counter() - start
+    return module
+
+
+def import_times():
+    # {module name: seconds} for the pages imported so far, in import order
+    with _lock:
+        return dict(_import_seconds)
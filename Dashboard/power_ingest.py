@@ -0,0 +1,287 @@
+"""Append NASA POWER daily exports from a drop directory to the historical dataset.
+
+Run from the repository root whenever new exports have been downloaded::
+
+    python Dashboard/power_ingest.py --drop Dashboard/data/power_drop
+
+Every CSV or JSON file in the drop directory (the "Download" formats of
+https://power.larc.nasa.gov/data-access-viewer/ and of its daily point API,
+with the parameters ALLSKY_KT, T2M, PRECTOTCORR, PS and WS10M) is read in name
+order, validated and normalized to the dataset schema. Only the days after the
+last stored day are appended, and they must continue the history daily (the
+forecaster's lags count rows): runs of up to MAX_FILL_DAYS missing days (the
+export's fill value, or absent dates) are interpolated, and the append stops
+before a longer gap or one no later day closes yet. The appended days get
+their Status from the site's k-means clusters (a mini-batch update, see
+clustering.py) and are written to HASIL_CLUSTERING.parts/ as one Feather
+part file; the CSV and the earlier parts are not rewritten, so an append
+costs O(new rows). load_data() merges the appended days into the history, in
+date order, and the forecast model state is updated with them (the next
+model_state_vNNNN.npz of the site, see model_update.py).
+
+Processed files are moved to <drop>/processed and rejected ones to
+<drop>/rejected; a file with days beyond an unfilled gap stays pending in the
+drop directory until later exports close the gap. The command then checks that
+the merged history is still daily and exits with status 1 if it is not. With
+--dry-run nothing is written or moved, e.g. to check the offline fixtures::
+
+    python Dashboard/power_ingest.py --drop Dashboard/fixtures/power --dry-run
+"""
+import argparse
+import io
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from sites import DEFAULT_SITE_ID, get_site
+from web_function import INDICATOR_COLUMNS, load_data, parts_dir, read_columnar, read_manifest
+
+# Fill value of POWER exports whose header does not state one
+FILL_VALUE = -999.0
+
+# Longest run of missing days filled by interpolation; a longer gap stops the append
+MAX_FILL_DAYS = 3
+
+
+def _frame(dates, columns, fill_value):
+    missing = [column for column in INDICATOR_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"missing parameter(s) {', '.join(missing)}")
+    df = pd.DataFrame({'DATE': pd.DatetimeIndex(dates).astype('datetime64[ns]')})
+    for column in INDICATOR_COLUMNS:
+        values = pd.to_numeric(pd.Series(columns[column]), errors='coerce').to_numpy(dtype='float64')
+        df[column] = np.where(values == fill_value, np.nan, values).astype('float32')
+    return df
+
+
+def read_power_csv(path):
+    # CSV download: a -BEGIN HEADER- ... -END HEADER- block, then YEAR,MO,DY (or YEAR,DOY) columns
+    with open(path) as f:
+        text = f.read()
+    fill_value = FILL_VALUE
+    if text.startswith('-BEGIN HEADER-'):
+        header, separator, text = text.partition('-END HEADER-')
+        if not separator:
+            raise ValueError("unterminated header")
+        for line in header.splitlines():
+            if 'missing' in line.lower() and ':' in line:
+                fill_value = float(line.rsplit(':', 1)[1])
+    rows = pd.read_csv(io.StringIO(text.lstrip()))
+    if {'YEAR', 'MO', 'DY'} <= set(rows.columns):
+        dates = pd.to_datetime(dict(year=rows['YEAR'], month=rows['MO'], day=rows['DY']))
+    elif {'YEAR', 'DOY'} <= set(rows.columns):
+        dates = pd.to_datetime(rows['YEAR'].astype(str) + rows['DOY'].astype(str).str.zfill(3), format='%Y%j')
+    else:
+        raise ValueError("no YEAR/MO/DY or YEAR/DOY columns")
+    return _frame(dates, {column: rows[column] for column in rows.columns}, fill_value)
+
+
+def read_power_json(path):
+    # JSON (GeoJSON) download: properties.parameter maps each parameter to {'YYYYMMDD': value}
+    with open(path) as f:
+        data = json.load(f)
+    try:
+        parameters = data['properties']['parameter']
+    except (KeyError, TypeError):
+        raise ValueError("no properties.parameter object") from None
+    fill_value = float(data.get('header', {}).get('fill_value', FILL_VALUE))
+    days = sorted(set().union(*(values.keys() for values in parameters.values())))
+    dates = pd.to_datetime(days, format='%Y%m%d')
+    columns = {name: [values.get(day, fill_value) for day in days] for name, values in parameters.items()}
+    return _frame(dates, columns, fill_value)
+
+
+READERS = {'.csv': read_power_csv, '.json': read_power_json}
+
+
+def read_drop(directory):
+    # Generator of (path, frame, error) for every export in the drop directory, in name
+    # order; frame is None when the file was rejected and error says why. Days with a
+    # missing value are kept (as NaN) so that continuation() can fill them.
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        reader = READERS.get(os.path.splitext(name)[1].lower())
+        if reader is None or not os.path.isfile(path):
+            continue
+        try:
+            df = reader(path)
+        except (ValueError, KeyError, OSError) as e:
+            yield path, None, str(e)
+            continue
+        # A date repeated in one file keeps its last row
+        df = df.drop_duplicates('DATE', keep='last')
+        yield path, df.sort_values('DATE', ignore_index=True), None
+
+
+def continuation(df, previous, max_fill=MAX_FILL_DAYS):
+    # Days of df that continue the history daily after its last row (previous), and how
+    # many of them were filled. Missing values of runs of at most max_fill incomplete or
+    # absent days between two complete days are interpolated linearly; the series stops
+    # before the first run that is longer, or that no complete day closes yet.
+    start = previous['DATE'] + pd.Timedelta(days=1)
+    df = df[df['DATE'] >= start]
+    if df.empty:
+        return df, 0
+    dates = pd.date_range(start, df['DATE'].max())
+    values = df.set_index('DATE')[INDICATOR_COLUMNS].astype('float64').reindex(dates)
+    incomplete = values.isna().any(axis=1).to_numpy()
+    cut, i = len(values), 0
+    while i < len(values):
+        if not incomplete[i]:
+            i += 1
+            continue
+        j = i
+        while j < len(values) and incomplete[j]:
+            j += 1
+        if j == len(values) or j - i > max_fill:
+            cut = i
+            break
+        i = j
+    anchor = pd.DataFrame([previous[INDICATOR_COLUMNS].to_numpy(dtype='float64')],
+                          index=[previous['DATE']], columns=INDICATOR_COLUMNS)
+    values = pd.concat([anchor, values.iloc[:cut]]).interpolate(limit_area='inside').iloc[1:]
+    rows = values.astype('float32').rename_axis('DATE').reset_index()
+    rows['DATE'] = rows['DATE'].astype('datetime64[ns]')
+    return rows, int(incomplete[:cut].sum())
+
+
+def gaps(dates):
+    # (day before, day after) of every break in a sorted daily series
+    dates = pd.DatetimeIndex(dates)
+    breaks = np.flatnonzero(np.diff(dates.asi8) != pd.Timedelta(days=1).value)
+    return [(dates[i], dates[i + 1]) for i in breaks]
+
+
+class PartStore:
+    # Append-only part files of one dataset. The manifest lists every part with its
+    # first and last date, and the CSV's date range under 'base', so finding where the
+    # dataset ends reads one part (or the CSV only when it changed).
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.directory = parts_dir(file_path)
+        self.manifest = read_manifest(self.directory)
+
+    def last_row(self):
+        # DATE and indicators of the latest stored day
+        stat = os.stat(self.file_path)
+        base = self.manifest.get('base')
+        if base is None or base['signature'] != [stat.st_mtime_ns, stat.st_size]:
+            dates = load_data(self.file_path, include_parts=False)['DATE']
+            self.manifest['base'] = {'signature': [stat.st_mtime_ns, stat.st_size],
+                                     'first': str(dates.min().date()), 'last': str(dates.max().date())}
+        parts = self.manifest['parts']
+        latest = max(parts, key=lambda part: part['last']) if parts else None
+        if latest is not None and latest['last'] > self.manifest['base']['last']:
+            df = read_columnar(os.path.join(self.directory, latest['file']))
+        else:
+            df = load_data(self.file_path, include_parts=False)
+        return df.loc[df['DATE'].idxmax(), ['DATE'] + INDICATOR_COLUMNS]
+
+    def append(self, df, filled=0):
+        # Writes df as the next part; the manifest is replaced last, so readers only ever
+        # see complete parts
+        from pyarrow import feather
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"part-{len(self.manifest['parts']) + 1:05d}.feather"
+        path = os.path.join(self.directory, name)
+        feather.write_feather(df.reset_index(drop=True), path + '.tmp', compression='uncompressed')
+        os.replace(path + '.tmp', path)
+        self.manifest['parts'].append({'file': name, 'rows': len(df), 'filled': filled,
+                                       'first': str(df['DATE'].min().date()), 'last': str(df['DATE'].max().date())})
+        self.save_manifest()
+
+    def save_manifest(self):
+        manifest = os.path.join(self.directory, 'manifest.json')
+        with open(manifest + '.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(manifest + '.tmp', manifest)
+
+
+def label(df, labeler):
+    # Status of the new days from the clustering the history's Status comes from; the
+    # centroids take the new days in, so the stored state must be saved afterwards
+    status = labeler.partial_fit(df[INDICATOR_COLUMNS].to_numpy(dtype='float64'))
+    return df.assign(Status=pd.Categorical(status, categories=sorted(set(labeler.names))))
+
+
+def append_days(site, store, rows, filled=0, state_directory=None):
+    # Labels rows (days continuing the history, without Status) and appends them as the
+    # next part; the clustering and the forecaster's state take the new days in as well.
+    # Returns the path of the new state (model_state_vNNNN.npz, see model_update.py).
+    from clustering import labeler_path, load_or_fit
+    from model_update import update_site_state
+    labeler = load_or_fit(site.history_path)
+    store.append(label(rows, labeler), filled)
+    labeler.save(labeler_path(site.history_path))
+    return update_site_state(site, state_directory)
+
+
+def ingest_drop(directory, site, dry_run=False):
+    # Appends the days of the exports that continue the site's history. Returns
+    # ([(path, outcome, days read, error)], appended rows, filled days); outcome is
+    # 'processed', 'rejected', or 'pending' for a file with days beyond a gap that cannot
+    # be filled yet: it stays in the drop directory and is read again with later exports.
+    results, read = [], []
+    for path, df, error in read_drop(directory):
+        if df is None:
+            results.append((path, 'rejected', 0, error))
+            _move(path, 'rejected', dry_run)
+        else:
+            read.append((path, df))
+    store = PartStore(site.history_path)
+    previous = store.last_row()
+    rows, filled = pd.DataFrame(columns=['DATE'] + INDICATOR_COLUMNS), 0
+    if read:
+        # Later files win; a value a later file is missing does not hide an earlier one
+        days = pd.concat([df for _, df in read], ignore_index=True).groupby('DATE', sort=True).last()
+        rows, filled = continuation(days.reset_index(), previous)
+    if not dry_run and not rows.empty:
+        append_days(site, store, rows, filled)
+    end = rows['DATE'].max() if not rows.empty else previous['DATE']
+    for path, df in read:
+        if df['DATE'].max() > end:
+            results.append((path, 'pending', len(df), None))
+        else:
+            results.append((path, 'processed', len(df), None))
+            _move(path, 'processed', dry_run)
+    return sorted(results), rows, filled
+
+
+def _move(path, folder, dry_run):
+    if dry_run:
+        return
+    target = os.path.join(os.path.dirname(path), folder)
+    os.makedirs(target, exist_ok=True)
+    os.replace(path, os.path.join(target, os.path.basename(path)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--drop', default='Dashboard/data/power_drop', help='directory of POWER exports')
+    parser.add_argument('--site', default=DEFAULT_SITE_ID, help='site whose history the exports extend')
+    parser.add_argument('--dry-run', action='store_true', help='validate and count only; write and move nothing')
+    args = parser.parse_args()
+
+    site = get_site(args.site)
+    results, rows, filled = ingest_drop(args.drop, site, args.dry_run)
+    for path, outcome, read, error in results:
+        print(f"{path}: {outcome} ({error})" if error else f"{path}: {read} days read, {outcome}")
+    action = 'would be appended' if args.dry_run else 'appended'
+    print(f"[{site.id}] {len(rows)} days ({filled} interpolated) {action} to {parts_dir(site.history_path)}")
+
+    # The merged history must stay daily: the forecaster's lags count rows, not days
+    dates = load_data(site.history_path)['DATE']
+    if args.dry_run:
+        dates = pd.concat([dates, rows['DATE']]).sort_values()
+    breaks = gaps(dates)
+    for before, after in breaks:
+        print(f"gap: {before.date()} -> {after.date()}")
+    if breaks:
+        sys.exit(1)
+    print(f"[{site.id}] history is daily from {dates.iloc[0].date()} to {dates.iloc[-1].date()}")
+
+if __name__ == '__main__':
+    main()
@@ -1,70 +1,156 @@
+import threading
+import weakref
+from collections import OrderedDict
 import streamlit as st
 import pandas as pd
-import joblib
-import numpy as np
 from datetime import datetime
+import model_registry
+from feature_store import FeatureStore
+from results_view import ROW_STYLES, render_results
+from exports import download_button
+from clustering import get_labeler
+from model_update import get_feature_stats
+from profiling import span, timed
+from probabilities import forecast_probabilities, get_calibration, upwelling_probability
+from sites import DEFAULT_SITE, MAX_ACTIVE_SITES
+from web_function import load_data, INDICATOR_LABELS_ID, get_forecast_store
 
-# Function to apply custom HTML style to the entire row based on the Prediksi column
-def render_styled_table(dataframe):
-    def highlight_row(row):
-        prediction = row['Prediksi']
-        if prediction == "BERPOTENSI UPWELLING":
-            return ['background-color: #FF7F7F; color: black'] * len(row)
-        elif prediction == "TIDAK BERPOTENSI UPWELLING":
-            return ['background-color: lightblue; color: black'] * len(row)
-        return [''] * len(row)
-    
-    styled_table = dataframe.style.apply(highlight_row, axis=1)
-    return styled_table
+# Columns of the prediction results table
+RESULT_COLUMNS = ['DATE', 'Indeks Kejernihan Langit', 'Suhu Pada Ketinggian 2 Meter', 'Curah Hujan', 'Tekanan Permukaan', 'Kecepatan Angin', 'Prediksi', 'Probabilitas Upwelling', 'Klaster']
+
+# Indicator columns of the forecast table after renaming
+INDICATOR_COLUMNS = RESULT_COLUMNS[1:6]
+
+# Calibrated probability of upwelling (Platt scaling of the SVM margin)
+PROBABILITY_COLUMN = 'Probabilitas Upwelling'
+
+# Status of the nearest k-means centroid (the clustering behind HASIL_CLUSTERING), a cross-check of the SVM
+CLUSTER_COLUMN = 'Klaster'
+
+# Feature order expected by the classifier (ALLSKY_KT, T2M, WS10M, PRECTOTCORR, PS)
+FEATURE_COLUMNS = ['Indeks Kejernihan Langit', 'Suhu Pada Ketinggian 2 Meter', 'Kecepatan Angin', 'Curah Hujan', 'Tekanan Permukaan']
 
 # Define a SessionState class for managing state across Streamlit reruns
 class SessionState:
     def __init__(self):
-        self.all_data = pd.DataFrame(columns=['DATE', 'Indeks Kejernihan Langit', 'Suhu Pada Ketinggian 2 Meter', 'Curah Hujan', 'Tekanan Permukaan', 'Kecepatan Angin', 'Prediksi'])
-        self.csv_data = pd.DataFrame(columns=['DATE', 'Indeks Kejernihan Langit', 'Suhu Pada Ketinggian 2 Meter', 'Curah Hujan', 'Tekanan Permukaan', 'Kecepatan Angin'])
+        self.all_data = pd.DataFrame(columns=RESULT_COLUMNS)
         self.auto_fill_message_shown = True  # Flag untuk menampilkan pesan auto-fill
-
-# Initialize state
-if 'session_state' not in st.session_state:
-    st.session_state.session_state = SessionState()
-state = st.session_state.session_state
-
-# Function to load the machine learning model
+        self.result_version = 0  # Incremented whenever all_data is replaced
+        self.rendered_pages = {}  # Rendered results table pages of the current version
+        self.site_id = None  # Site the results belong to
+
+# State of the current browser session. Looked up on every run: this module is
+# imported once per server process and shared by all sessions.
+def get_state():
+    if 'session_state' not in st.session_state:
+        st.session_state.session_state = SessionState()
+    return st.session_state.session_state
+
+# Function to load the machine learning model (cached per server process, reloaded when the file changes)
 def load_model(model_path):
-    model = joblib.load(model_path)
+    model = model_registry.get_model(model_path)
     return model
 
+# Date-indexed view of each site's current forecast snapshot. A write to the site's
+# ForecastStore drops the view through the store's change hook (watch_forecast_store), and
+# the snapshot identity check rebuilds it if a session still holds an older snapshot.
+# The least recently used sites' views are dropped beyond MAX_ACTIVE_SITES
+_feature_stores = OrderedDict()
+_feature_stores_lock = threading.Lock()
+
+@timed
+def get_feature_store(site_id, snapshot):
+    with _feature_stores_lock:
+        entry = _feature_stores.get(site_id)
+        if entry is not None and entry[0] is snapshot:
+            _feature_stores.move_to_end(site_id)
+            return entry[1]
+    store = FeatureStore(snapshot.data.rename(columns={**INDICATOR_LABELS_ID, 'P_UPWELLING': PROBABILITY_COLUMN}))
+    with _feature_stores_lock:
+        _feature_stores[site_id] = (snapshot, store)
+        _feature_stores.move_to_end(site_id)
+        while len(_feature_stores) > MAX_ACTIVE_SITES:
+            _feature_stores.popitem(last=False)
+    return store
+
+_watched_stores = weakref.WeakSet()
+
+def watch_forecast_store(site_id, forecast_store):
+    # Drops the site's view as soon as its store gets a new snapshot, instead of keeping the
+    # old index until the next rerun; subscribes once per store
+    with _feature_stores_lock:
+        if forecast_store in _watched_stores:
+            return
+        _watched_stores.add(forecast_store)
+
+    def invalidate(snapshot):
+        with _feature_stores_lock:
+            _feature_stores.pop(site_id, None)
+    forecast_store.subscribe(invalidate)
+
 # Function to perform prediction
+@timed
 def predict(model, input_features):
     predictions = model.predict(input_features)
     return predictions
 
+# Function to predict every row of input_data (list of dicts or DataFrame) with a single model call.
+# Rows without a precomputed probability (manual input) get one from a single batched call.
+@timed
+def predict_batch(model, input_data, calibration=None, labeler=None):
+    results = pd.DataFrame(input_data, columns=[column for column in RESULT_COLUMNS
+                                                if column not in ('Prediksi', CLUSTER_COLUMN)])
+    if results.empty:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    input_array = results[FEATURE_COLUMNS].to_numpy(dtype=float)
+    results.insert(len(INDICATOR_COLUMNS) + 1, 'Prediksi',
+                   pd.Categorical(predict(model, input_array), categories=list(ROW_STYLES)))
+    results[PROBABILITY_COLUMN] = results[PROBABILITY_COLUMN].astype(float)
+    missing = results[PROBABILITY_COLUMN].isna().to_numpy()
+    if calibration is not None and missing.any():
+        results.loc[missing, PROBABILITY_COLUMN] = upwelling_probability(model, calibration, input_array[missing])[0]
+    if labeler is not None:
+        clusters = labeler.predict(results[INDICATOR_COLUMNS].to_numpy(dtype=float))
+        results[CLUSTER_COLUMN] = pd.Categorical(clusters, categories=list(ROW_STYLES))
+    # Sorted once here, with DATE kept as datetime, instead of on every rerun
+    return results.sort_values(by=['DATE'], kind='stable', ignore_index=True)
+
 # Function to display the prediction interface
-def app():
+def app(site=DEFAULT_SITE):
+    state = get_state()
+    if state.site_id != site.id:
+        # Results of another site are not shown
+        state.all_data = pd.DataFrame(columns=RESULT_COLUMNS)
+        state.result_version += 1
+        state.site_id = site.id
     st.title("Upwelling Prediction")
+    st.subheader(site.name)
     st.write("#### Pastikan Menekan Tombol Predict Upwelling Saat Memprediksi")
 
-    # Load the model
-    model_path = "Dashboard/data/model_klasifikasi.pkl"
+    # Load the site's model (the default classifier when the site has none of its own)
+    model_path = site.model_path
     model = load_model(model_path)
+    model_info = model_registry.get_entry(model_path)
+    st.caption(f"Model loaded ({model_info.runtime}) in {model_info.load_seconds:.3f} s, "
+               f"{model_info.footprint_bytes / 1024:.1f} KiB in memory (sha256 {model_info.sha256[:12]})")
 
-    # Load data from data.csv
+    # Load data from data.csv (parsed once and shared through the dataset cache)
     try:
-        state.csv_data = pd.read_csv('Dashboard/data/Data_Hasil_Forcast_2_Tahun_(2024-2025).csv')
-        state.csv_data['DATE'] = pd.to_datetime(state.csv_data['DATE'], format='%d/%m/%Y')
-        state.csv_data['DATE'] = state.csv_data['DATE'].dt.date  # Convert to date only (no time component)
+        forecast_data = load_data(site.forecast_path)
     except Exception as e:
         st.error(f"Error loading data.csv: {e}")
         return
 
-    # Rename columns in csv_data
-    state.csv_data.rename(columns={
-        'ALLSKY_KT': 'Indeks Kejernihan Langit',
-        'T2M': 'Suhu Pada Ketinggian 2 Meter',
-        'PRECTOTCORR': 'Curah Hujan',
-        'PS': 'Tekanan Permukaan',
-        'WS10M': 'Kecepatan Angin'
-    }, inplace=True)
+    # Publish the forecast table, with the upwelling probability of every day (precomputed at
+    # ingest), to the site's shared store whenever the file was (re)loaded or the model changed
+    forecast_store = get_forecast_store(site.id)
+    watch_forecast_store(site.id, forecast_store)
+    snapshot = forecast_store.get()
+    if not snapshot.is_of(forecast_data, model_info.sha256):
+        probabilities = forecast_probabilities(site.forecast_path, forecast_data, model, model_info.sha256,
+                                               site.history_path)
+        snapshot = forecast_store.set(forecast_data.assign(P_UPWELLING=probabilities['P_UPWELLING']),
+                                      source=forecast_data, model_version=model_info.sha256)
 
     # Sidebar inputs for selecting date range
     date_range = st.date_input('Select Date Range', [])
@@ -74,33 +160,32 @@ def app():
     start_date, end_date = date_range
     selected_dates = pd.date_range(start=start_date, end=end_date).date
 
-    results = []
-    input_data = []
+    predicted = False
+
+    # Resolve the whole range against the forecast table in one lookup
+    store = get_feature_store(site.id, snapshot)
+    found_rows, missing_dates = store.lookup(selected_dates)
 
-    for selected_date in selected_dates:
+    # Auto-fill inputs for the dates that exist in the forecast table
+    input_data = found_rows[INDICATOR_COLUMNS + [PROBABILITY_COLUMN]].astype(float).reset_index(drop=True)
+    input_data.insert(0, 'DATE', found_rows.index)
+    if not found_rows.empty and not state.auto_fill_message_shown:
+        st.success("Data found, auto-filled the fields.")
+        state.auto_fill_message_shown = True
+
+    manual_data = []
+    for selected_date in missing_dates:
         selected_date_str = selected_date.strftime('%d/%m/%Y')  # Change the format to dd/mm/yyyy
 
-        # Check if data exists for selected date and auto-fill inputs
-        if not state.csv_data.empty and selected_date in state.csv_data['DATE'].values:
-            row_data = state.csv_data[state.csv_data['DATE'] == selected_date].iloc[0]
-            allsky_kt = row_data['Indeks Kejernihan Langit']
-            t2m = row_data['Suhu Pada Ketinggian 2 Meter']
-            prectotcorr = row_data['Curah Hujan']
-            ps = row_data['Tekanan Permukaan']
-            ws10m = row_data['Kecepatan Angin']
-            if not state.auto_fill_message_shown:
-                st.success("Data found, auto-filled the fields.")
-                state.auto_fill_message_shown = True
-        else:
-            st.warning(f"Data not found for {selected_date_str}. Please input the values manually.")
-            allsky_kt = st.number_input(f'Indeks Kejernihan Langit for {selected_date_str}', value=0.00)
-            t2m = st.number_input(f'Suhu Pada Ketinggian 2 Meter for {selected_date_str}', value=0.00)
-            prectotcorr = st.number_input(f'Curah Hujan for {selected_date_str}', value=0.00)
-            ps = st.number_input(f'Tekanan Permukaan for {selected_date_str}', value=0.00)
-            ws10m = st.number_input(f'Kecepatan Angin for {selected_date_str}', value=0.00)
-
-        input_data.append({
-            'DATE': selected_date_str,
+        st.warning(f"Data not found for {selected_date_str}. Please input the values manually.")
+        allsky_kt = st.number_input(f'Indeks Kejernihan Langit for {selected_date_str}', value=0.00)
+        t2m = st.number_input(f'Suhu Pada Ketinggian 2 Meter for {selected_date_str}', value=0.00)
+        prectotcorr = st.number_input(f'Curah Hujan for {selected_date_str}', value=0.00)
+        ps = st.number_input(f'Tekanan Permukaan for {selected_date_str}', value=0.00)
+        ws10m = st.number_input(f'Kecepatan Angin for {selected_date_str}', value=0.00)
+
+        manual_data.append({
+            'DATE': pd.Timestamp(selected_date),
             'Indeks Kejernihan Langit': float(allsky_kt),
             'Suhu Pada Ketinggian 2 Meter': float(t2m),
             'Curah Hujan': float(prectotcorr),
@@ -108,62 +193,46 @@ def app():
             'Kecepatan Angin': float(ws10m)
         })
 
+    if manual_data:
+        input_data = pd.concat([input_data, pd.DataFrame(manual_data)], ignore_index=True)
+
     # Display prediction result
     if st.button("Predict Upwelling"):
-        # Clear previous predictions
-        state.all_data = pd.DataFrame(columns=['DATE', 'Indeks Kejernihan Langit', 'Suhu Pada Ketinggian 2 Meter', 'Curah Hujan', 'Tekanan Permukaan', 'Kecepatan Angin', 'Prediksi'])
-        
-        for data in input_data:
-            try:
-                input_features = [[data['Indeks Kejernihan Langit'], data['Suhu Pada Ketinggian 2 Meter'], data['Kecepatan Angin'], data['Curah Hujan'], data['Tekanan Permukaan']]]
-                input_array = np.array(input_features)
-                hasil_prediksi = predict(model, input_array)
-
-                # Store prediction result and input data in state or any storage mechanism
-                new_data = {
-                    'DATE': [data['DATE']],
-                    'Indeks Kejernihan Langit': [data['Indeks Kejernihan Langit']],
-                    'Suhu Pada Ketinggian 2 Meter': [data['Suhu Pada Ketinggian 2 Meter']],
-                    'Curah Hujan': [data['Curah Hujan']],
-                    'Tekanan Permukaan': [data['Tekanan Permukaan']],
-                    'Kecepatan Angin': [data['Kecepatan Angin']],
-                    'Prediksi': hasil_prediksi[0]  # Ambil prediksi sebagai string, bukan list
-                }
-
-                state.all_data = pd.concat([state.all_data, pd.DataFrame(new_data)], ignore_index=True)
-                results.append(new_data)
-            except ValueError:
-                st.warning("Please enter valid numeric values.")
-
-    if results:
+        try:
+            # One model.predict call over the whole date range
+            state.all_data = predict_batch(model, input_data, get_calibration(model, model_info.sha256, site.history_path),
+                                           get_labeler(site.history_path))
+            predicted = True
+        except ValueError:
+            state.all_data = pd.DataFrame(columns=RESULT_COLUMNS)
+            st.warning("Please enter valid numeric values.")
+        state.result_version += 1
+
+    if predicted:
         st.success("Predictions completed for the selected date range.")
 
-    # Display all_data table
-    # Convert DATE back to datetime for sorting
-    state.all_data['DATE'] = pd.to_datetime(state.all_data['DATE'], format='%d/%m/%Y')
-
-    # Sort by DATE in ascending order
-    state.all_data = state.all_data.sort_values(by=['DATE'], ascending=True)
-
-    # Convert back to string format after sorting
-    state.all_data['DATE'] = state.all_data['DATE'].dt.strftime('%d/%m/%Y')
-
-    # Format numeric columns to display float with two decimal places
-    formatted_data = state.all_data.copy()
-    numeric_columns = ['Indeks Kejernihan Langit', 'Suhu Pada Ketinggian 2 Meter', 'Curah Hujan', 'Tekanan Permukaan', 'Kecepatan Angin']
-
-    for col in numeric_columns:
-        formatted_data[col] = formatted_data[col].apply(lambda x: f"{x:.2f}")
-
-    # Render the styled table using custom styling
-    styled_table = render_styled_table(formatted_data)
-    
-    st.write(styled_table.to_html(), unsafe_allow_html=True)
-
-    # Download button for CSV
+    # Agreement of the SVM with the nearest-centroid assignment of the clustering
+    if not state.all_data.empty and state.all_data[CLUSTER_COLUMN].notna().any():
+        agree = int((state.all_data['Prediksi'] == state.all_data[CLUSTER_COLUMN]).sum())
+        st.caption(f"Prediksi SVM sama dengan klaster terdekat pada {agree} dari {len(state.all_data)} hari")
+
+    # Days whose indicators lie outside everything the site's history has seen (statistics of
+    # the latest model state, updated with every appended day)
+    feature_stats = get_feature_stats(site.directory)
+    if feature_stats is not None and not state.all_data.empty:
+        outside = int(feature_stats.outside(state.all_data[INDICATOR_COLUMNS].to_numpy(dtype=float)).sum())
+        if outside:
+            st.caption(f"{outside} dari {len(state.all_data)} hari memiliki indikator di luar rentang data historis "
+                       f"({feature_stats.count} hari); prediksinya kurang dapat diandalkan")
+
+    # Display all_data table (paginated, rendered once per result version)
+    with span('predict.render_results'):
+        render_results(state.all_data, state.result_version, state.rendered_pages, percent_columns=[PROBABILITY_COLUMN])
+
+    # Download button (the file is generated only when requested)
     if not state.all_data.empty:
-        csv_data = state.all_data.to_csv(index=False)
-        st.download_button(label="Download CSV", data=csv_data, file_name='predicted_results.csv', key='download_button')
+        download_button(state.all_data, ('predict',), state.all_data, 'predicted_results',
+                        date_format='%d/%m/%Y', widget_key='download_button')
 
     st.text("This tool predicts upwelling potential based on various weather parameters. Use the input fields to enter the weather data, and click 'Predict Upwelling' to see the results.")
 
@@ -0,0 +1,165 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from sites import DEFAULT_SITE, MAX_ACTIVE_SITES
+from web_function import MODEL_FEATURES, derived_is_fresh, load_data
+
+UPWELLING = 'BERPOTENSI UPWELLING'
+
+# Labelled days the probabilities are calibrated on (each site calibrates on its own history)
+CALIBRATION_PATH = DEFAULT_SITE.history_path
+
+
+def upwelling_margin(model, X):
+    # Signed SVM margin, positive on the upwelling side (works for SVC and CompiledSVM)
+    decision = model.decision_function(np.asarray(X, dtype='float64'))
+    return -decision if model.classes_[0] == UPWELLING else decision
+
+
+def platt_fit(margin, upwelling, max_iter=100):
+    # Platt scaling, P(upwelling | m) = 1 / (1 + exp(a*m + b)), fitted by Newton's method with
+    # backtracking as in Lin, Lin and Weng (2007). The smoothed targets keep a and b finite
+    # even when the margins separate the labels perfectly.
+    margin = np.asarray(margin, dtype='float64')
+    upwelling = np.asarray(upwelling, dtype=bool)
+    positives = upwelling.sum()
+    negatives = len(upwelling) - positives
+    target = np.where(upwelling, (positives + 1) / (positives + 2), 1 / (negatives + 2))
+
+    def objective(a, b):
+        z = margin * a + b
+        return np.sum(np.where(z >= 0, target * z + np.log1p(np.exp(-np.abs(z))),
+                               (target - 1) * z + np.log1p(np.exp(-np.abs(z)))))
+
+    a, b = 0.0, np.log((negatives + 1) / (positives + 1))
+    value = objective(a, b)
+    for _ in range(max_iter):
+        p = 1 / (1 + np.exp(np.clip(margin * a + b, -700, 700)))
+        d2 = p * (1 - p)
+        h11 = 1e-12 + np.sum(margin * margin * d2)
+        h22 = 1e-12 + np.sum(d2)
+        h21 = np.sum(margin * d2)
+        d1 = target - p
+        g1, g2 = np.sum(margin * d1), np.sum(d1)
+        if abs(g1) < 1e-5 and abs(g2) < 1e-5:
+            break
+        det = h11 * h22 - h21 * h21
+        da = -(h22 * g1 - h21 * g2) / det
+        db = -(-h21 * g1 + h11 * g2) / det
+        slope = g1 * da + g2 * db
+        step = 1.0
+        while step >= 1e-10:
+            new_value = objective(a + step * da, b + step * db)
+            if new_value < value + 1e-4 * step * slope:
+                a, b, value = a + step * da, b + step * db, new_value
+                break
+            step /= 2
+        else:
+            break
+    return a, b
+
+
+class Calibration:
+    def __init__(self, a, b, model_sha256):
+        self.a = float(a)
+        self.b = float(b)
+        self.model_sha256 = model_sha256  # Version tag: the model file the calibration belongs to
+
+    @classmethod
+    def fit(cls, model, model_sha256, history):
+        margin = upwelling_margin(model, history[MODEL_FEATURES].to_numpy(dtype='float64'))
+        return cls(*platt_fit(margin, history['Status'].astype(str).to_numpy() == UPWELLING), model_sha256)
+
+    def probability(self, margin):
+        return 1 / (1 + np.exp(np.clip(self.a * np.asarray(margin) + self.b, -700, 700)))
+
+
+def upwelling_probability(model, calibration, X):
+    # (probability, margin) of every row of X, from a single decision-function call
+    margin = upwelling_margin(model, X)
+    return calibration.probability(margin), margin
+
+
+def probabilities_path(file_path):
+    # Precomputed probabilities of a forecast table, written next to its CSV by ingest.py
+    return os.path.splitext(file_path)[0] + '.probabilities.npz'
+
+
+def save_probabilities(path, dates, probability, margin, calibration):
+    np.savez(path, dates=np.asarray(dates, dtype='datetime64[ns]').astype('int64'),
+             probability=probability, margin=margin, a=calibration.a, b=calibration.b,
+             model_sha256=calibration.model_sha256)
+
+
+def _load_probabilities(path, model_sha256, dates):
+    # Stored probabilities, or None when they belong to another model or other dates
+    with np.load(path) as data:
+        if str(data['model_sha256']) != model_sha256:
+            return None
+        if not np.array_equal(data['dates'], np.asarray(dates, dtype='datetime64[ns]').astype('int64')):
+            return None
+        calibration = Calibration(data['a'], data['b'], model_sha256)
+        return data['probability'], data['margin'], calibration
+
+
+# Calibrations and forecast probabilities shared by every session, keyed by the model's sha256
+# and the site's history (and the forecast frame load_data returned), so a new model file or
+# a reloaded forecast leads to a recomputation and nothing else does. The least recently
+# used entries are dropped beyond MAX_ACTIVE_SITES.
+_calibrations = OrderedDict()
+_forecasts = OrderedDict()
+_lock = threading.Lock()
+
+
+def _remember(cache, key, value):
+    # Called with _lock held
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > MAX_ACTIVE_SITES:
+        cache.popitem(last=False)
+
+
+def get_calibration(model, model_sha256, history_path=CALIBRATION_PATH):
+    key = (model_sha256, history_path)
+    with _lock:
+        calibration = _calibrations.get(key)
+    if calibration is None:
+        # Only the days of the CSV: rows appended by power_ingest.py are labelled by
+        # mini-batch updates of the clusters rather than the original clustering
+        calibration = Calibration.fit(model, model_sha256, load_data(history_path, include_parts=False))
+        with _lock:
+            _remember(_calibrations, key, calibration)
+    return calibration
+
+
+def forecast_probabilities(file_path, forecast, model, model_sha256, history_path=CALIBRATION_PATH):
+    # (probability, margin) per row of a forecast table: read from the file written at
+    # ingest when it matches the model and the dates, computed in one batch otherwise
+    key = (file_path, model_sha256)
+    with _lock:
+        entry = _forecasts.get(key)
+        if entry is not None and entry[0] is forecast:
+            _forecasts.move_to_end(key)
+            return entry[1]
+
+    stored = None
+    path = probabilities_path(file_path)
+    if derived_is_fresh(path, file_path):
+        stored = _load_probabilities(path, model_sha256, forecast['DATE'].to_numpy())
+    if stored is not None:
+        probability, margin, calibration = stored
+        with _lock:
+            if (model_sha256, history_path) not in _calibrations:
+                _remember(_calibrations, (model_sha256, history_path), calibration)
+    else:
+        calibration = get_calibration(model, model_sha256, history_path)
+        probability, margin = upwelling_probability(model, calibration, forecast[MODEL_FEATURES])
+
+    result = pd.DataFrame({'P_UPWELLING': probability, 'MARGIN': margin}, index=forecast.index)
+    with _lock:
+        _remember(_forecasts, key, (forecast, result))
+    return result
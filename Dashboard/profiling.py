@@ -0,0 +1,106 @@
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# Lightweight profiler of the dashboard's hot paths. Functions decorated with @timed and
+# blocks wrapped in `with span(name):` record their wall time and the change in the number
+# of allocated memory blocks (sys.getallocatedblocks, process-wide, so other threads'
+# allocations are included) into a bounded ring buffer shared by the server process.
+#
+# Recording is off unless the DASHBOARD_PROFILE environment variable is set (or
+# set_enabled(True) is called): a disabled @timed costs one global lookup per call and a
+# disabled span() returns a shared no-op context manager.
+enabled = bool(os.environ.get('DASHBOARD_PROFILE'))
+
+# Most recent records kept; older ones are overwritten
+RING_SIZE = int(os.environ.get('DASHBOARD_PROFILE_RECORDS', 5000))
+
+_records = deque(maxlen=RING_SIZE)
+_local = threading.local()
+_runs = iter(range(1, sys.maxsize))
+_runs_lock = threading.Lock()
+_null = contextlib.nullcontext()
+
+
+def set_enabled(value):
+    global enabled
+    enabled = bool(value)
+
+
+def begin_run():
+    # Starts a new script run on this thread (one Streamlit session runs its script on one
+    # thread at a time); records made afterwards on the thread carry its id
+    with _runs_lock:
+        _local.run = next(_runs)
+    return _local.run
+
+
+def _record(name, start, seconds, blocks):
+    # deque.append is atomic, so sessions record without a lock
+    _records.append({'name': name, 'start': start, 'seconds': seconds, 'blocks': blocks,
+                     'run': getattr(_local, 'run', 0), 'thread': threading.current_thread().name})
+
+
+@contextlib.contextmanager
+def _span(name):
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _record(name, start, seconds, sys.getallocatedblocks() - blocks)
+
+
+def span(name):
+    return _span(name) if enabled else _null
+
+
+def timed(func=None, name=None):
+    # @timed or @timed(name='...'); records under module.qualname by default
+    if func is None:
+        return lambda func: timed(func, name)
+    label = name or f'{func.__module__}.{func.__qualname__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return func(*args, **kwargs)
+        with _span(label):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def records(run=None):
+    # Snapshot of the ring buffer, oldest first; only the given run's records when run is set
+    snapshot = list(_records)
+    return snapshot if run is None else [record for record in snapshot if record['run'] == run]
+
+
+def summary(run=None):
+    # Per name: calls, total/mean/max seconds and allocated blocks, slowest total first
+    totals = {}
+    for record in records(run):
+        entry = totals.setdefault(record['name'], {'name': record['name'], 'calls': 0, 'total_s': 0.0,
+                                                   'max_s': 0.0, 'blocks': 0})
+        entry['calls'] += 1
+        entry['total_s'] += record['seconds']
+        entry['max_s'] = max(entry['max_s'], record['seconds'])
+        entry['blocks'] += record['blocks']
+    rows = sorted(totals.values(), key=lambda entry: entry['total_s'], reverse=True)
+    return [{'name': entry['name'], 'calls': entry['calls'], 'total_s': entry['total_s'],
+             'mean_s': entry['total_s'] / entry['calls'], 'max_s': entry['max_s'], 'blocks': entry['blocks']}
+            for entry in rows]
+
+
+def export_json(run=None):
+    return json.dumps({'records': records(run), 'summary': summary(run)}, indent=1)
+
+
+def clear():
+    _records.clear()
@@ -0,0 +1,66 @@
+import html
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from profiling import timed
+
+# Row colour of each prediction label
+ROW_STYLES = {
+    'BERPOTENSI UPWELLING': 'background-color: #FF7F7F; color: black',
+    'TIDAK BERPOTENSI UPWELLING': 'background-color: lightblue; color: black',
+}
+
+# Rows rendered per page of the results table
+PAGE_SIZE = 50
+
+
+def _cells(column):
+    # Display strings of one column of a page, built per column rather than per cell
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column.dt.strftime('%d/%m/%Y').to_numpy(dtype=object)
+    if pd.api.types.is_float_dtype(column):
+        return np.char.mod('%.2f', column.to_numpy(dtype='float64')).astype(object)
+    categorical = pd.Categorical(column)
+    labels = np.array([html.escape(str(label)) for label in categorical.categories] + [''], dtype=object)
+    return labels[categorical.codes]
+
+
+@timed
+def results_page_html(results, start, stop, label_column, percent_columns=()):
+    # HTML of rows start:stop, coloured by label with one categorical lookup;
+    # percent_columns hold fractions shown as percentages
+    page = results.iloc[start:stop]
+    codes = pd.Categorical(page[label_column], categories=list(ROW_STYLES)).codes
+    styles = np.array(list(ROW_STYLES.values()) + [''], dtype=object)[codes]  # Unknown label (-1): no colour
+
+    rows = np.full(len(page), '', dtype=object)
+    for name in page.columns:
+        if name in percent_columns:
+            cells = np.char.mod('%.1f%%', 100 * page[name].to_numpy(dtype='float64')).astype(object)
+        else:
+            cells = _cells(page[name])
+        rows = rows + '<td>' + cells + '</td>'
+    header = ''.join(f'<th>{html.escape(str(name))}</th>' for name in page.columns)
+    body = ''.join('<tr style="' + styles + '">' + rows + '</tr>')
+    return f'<table><thead><tr>{header}</tr></thead><tbody>{body}</tbody></table>'
+
+
+def render_results(results, version, cache, label_column='Prediksi', percent_columns=(), key='results'):
+    # Paginated results table. Rendered pages are kept in `cache` (per session) for the
+    # current result version, so reruns that do not change the results re-send the HTML as is.
+    pages = max(-(-len(results) // PAGE_SIZE), 1)
+    page = 1
+    if pages > 1:
+        page = st.number_input(f'Halaman (1-{pages})', min_value=1, max_value=pages, value=1, step=1, key=key)
+    start, stop = (page - 1) * PAGE_SIZE, min(page * PAGE_SIZE, len(results))
+
+    if cache.get('version') != version:
+        cache.clear()
+        cache['version'] = version
+    if page not in cache:
+        cache[page] = results_page_html(results, start, stop, label_column, percent_columns)
+    st.write(cache[page], unsafe_allow_html=True)
+    if pages > 1:
+        st.caption(f"Baris {start + 1}-{stop} dari {len(results)}")
@@ -0,0 +1,158 @@
+"""Score CSV or Parquet files of daily indicators with the upwelling classifier.
+
+Run from the repository root::
+
+    python Dashboard/score.py lake_a.csv lake_b.parquet --chunk-size 100000 --workers 4
+
+Every input is read in chunks of --chunk-size rows, so memory stays bounded
+by the chunks in flight (about two per worker) whatever the file size. The
+input columns ALLSKY_KT, T2M, WS10M, PRECTOTCORR and PS (or their Indonesian
+labels from the Prediction page) are passed to the model in the same order
+as on the Prediction page. Each file is written next to its input (or into
+--output-dir) as <name>.scored.<ext>, with every input column plus the
+predicted label. Rows with a missing indicator get an empty label.
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import model_registry
+from web_function import INDICATOR_LABELS_ID, MODEL_FEATURES
+
+MODEL_PATH = 'Dashboard/data/model_klasifikasi.pkl'
+
+# Indonesian column labels accepted in place of the NASA POWER names
+_FEATURE_ALIASES = {label: column for column, label in INDICATOR_LABELS_ID.items()}
+
+
+def feature_matrix(chunk):
+    # (rows, 5) float64 matrix in the classifier's feature order
+    chunk = chunk.rename(columns={label: column for label, column in _FEATURE_ALIASES.items()
+                                  if label in chunk.columns and column not in chunk.columns})
+    missing = [column for column in MODEL_FEATURES if column not in chunk.columns]
+    if missing:
+        raise ValueError(f"Input is missing the indicator column(s) {', '.join(missing)}")
+    return chunk[MODEL_FEATURES].to_numpy(dtype='float64')
+
+
+def score_matrix(model, features):
+    labels = np.full(len(features), '', dtype=object)
+    valid = ~np.isnan(features).any(axis=1)
+    if valid.any():
+        labels[valid] = model.predict(features[valid])
+    return labels
+
+
+def read_chunks(path, chunk_size):
+    if path.endswith('.parquet'):
+        from pyarrow import parquet
+        for batch in parquet.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+class ChunkWriter:
+    # Appends scored chunks to a CSV or Parquet file, creating it on the first chunk
+    def __init__(self, path):
+        self.path = path
+        self._parquet = None
+        self._started = False
+
+    def write(self, chunk):
+        if self.path.endswith('.parquet'):
+            import pyarrow as pa
+            from pyarrow import parquet
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = parquet.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+        else:
+            chunk.to_csv(self.path, mode='a' if self._started else 'w', header=not self._started, index=False)
+        self._started = True
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def output_path(path, output_dir=None):
+    stem, ext = os.path.splitext(os.path.basename(path))
+    return os.path.join(output_dir or os.path.dirname(path), f'{stem}.scored{ext}')
+
+
+# Worker-side model, loaded once per worker process
+_worker = {}
+
+def _init_worker(model_path):
+    _worker['model'] = model_registry.get_model(model_path)
+
+
+def _score_in_worker(features):
+    return score_matrix(_worker['model'], features)
+
+
+def score_file(path, target, model_path=MODEL_PATH, chunk_size=100_000, label_column='Prediksi',
+               pool=None, max_pending=2):
+    # Scores one file chunk by chunk and returns the number of rows written. With a process
+    # pool, at most max_pending chunks are in flight and results are written in input order.
+    model = model_registry.get_model(model_path) if pool is None else None
+    writer = ChunkWriter(target)
+    pending = deque()
+    rows = 0
+
+    def write_next():
+        chunk, labels = pending.popleft()
+        chunk[label_column] = labels if pool is None else labels.result()
+        writer.write(chunk)
+        return len(chunk)
+
+    try:
+        for chunk in read_chunks(path, chunk_size):
+            features = feature_matrix(chunk)
+            if pool is None:
+                pending.append((chunk, score_matrix(model, features)))
+            else:
+                pending.append((chunk, pool.submit(_score_in_worker, features)))
+            if len(pending) >= max_pending:
+                rows += write_next()
+        while pending:
+            rows += write_next()
+    finally:
+        writer.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', help='CSV or Parquet files of daily indicators')
+    parser.add_argument('--model', default=MODEL_PATH, help='classifier to score with')
+    parser.add_argument('--chunk-size', type=int, default=100_000, help='rows read and scored at a time')
+    parser.add_argument('--workers', type=int, default=1, help='scoring processes; 1 = in-process')
+    parser.add_argument('--label-column', default='Prediksi', help='name of the predicted label column')
+    parser.add_argument('--output-dir', default=None, help='default: next to each input file')
+    args = parser.parse_args()
+
+    pool = None
+    if args.workers > 1:
+        pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.model,))
+    try:
+        for path in args.files:
+            start = time.perf_counter()
+            target = output_path(path, args.output_dir)
+            rows = score_file(path, target, args.model, args.chunk_size, args.label_column, pool,
+                              max_pending=2 * args.workers)
+            elapsed = time.perf_counter() - start
+            print(f"{path} -> {target}: {rows} rows in {elapsed:.1f} s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,401 @@
+"""Local HTTP API for upwelling predictions and forecasts.
+
+Run from the repository root (standard library only, no external services)::
+
+    python Dashboard/service.py --port 8600 --max-wait-ms 5
+
+Endpoints (JSON responses):
+
+    GET  /predict?date=2024-01-05             forecast indicators of a day and their prediction
+    GET  /predict?start=2024-01-01&end=...    the same for every day of a range
+    POST /predict                             {"rows": [{"ALLSKY_KT": ..., "T2M": ..., ...}]}
+    GET  /forecast?start=...&end=...          forecast indicators of a range
+    GET  /metrics                             latency histograms (Prometheus text format)
+    GET  /health
+
+Concurrent /predict requests are queued and scored together: the batcher
+waits at most --max-wait-ms (or until --max-batch rows are queued) and then
+makes a single model.predict call for the whole batch, in a worker thread.
+
+Forecasts come from the site's VAR engine, as on the Forecast page: the
+latest saved model state (Dashboard/model_update.py) brought up to the end of
+the history, or a model fitted on the history when no state is saved yet.
+--forecast serves a fixed forecast table instead.
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import model_registry
+from feature_store import FeatureStore
+from model_update import get_state_forecaster
+from sites import DEFAULT_SITE, DEFAULT_SITE_ID, get_site
+from web_function import INDICATOR_COLUMNS, MODEL_FEATURES, load_data
+
+MODEL_PATH = DEFAULT_SITE.model_path
+
+# Days forecast by the VAR engine, the same horizon as the Forecast page
+FORECAST_HORIZON_DAYS = 3650
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+
+# Upper bounds of the batch size histogram buckets (rows per model.predict call)
+BATCH_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+
+# Longest range a single request may ask for
+MAX_RANGE_DAYS = 3660
+
+# Paths served; every other path is counted under path="other" in the metrics
+ROUTES = ('/predict', '/forecast', '/health', '/metrics')
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot: above the largest bucket
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[int(np.searchsorted(self.buckets, value, side='left'))] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name, labels=''):
+        # Prometheus exposition: cumulative bucket counts, then sum and count
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ['+Inf'], self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {self.total}')
+        lines.append(f'{name}_count{suffix} {self.count}')
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.latency = {}  # (method, path, status) -> Histogram
+        self.batch_size = Histogram(BATCH_BUCKETS)
+        self.batch_seconds = Histogram(LATENCY_BUCKETS)
+
+    def observe_request(self, method, path, status, seconds):
+        key = (method, path if path in ROUTES else 'other', status)
+        if key not in self.latency:
+            self.latency[key] = Histogram(LATENCY_BUCKETS)
+        self.latency[key].observe(seconds)
+
+    def render(self):
+        lines = ['# TYPE upwelling_request_seconds histogram']
+        for (method, path, status), histogram in sorted(self.latency.items()):
+            labels = f'method="{method}",path="{path}",status="{status}"'
+            lines += histogram.render('upwelling_request_seconds', labels)
+        lines.append('# TYPE upwelling_batch_rows histogram')
+        lines += self.batch_size.render('upwelling_batch_rows')
+        lines.append('# TYPE upwelling_batch_seconds histogram')
+        lines += self.batch_seconds.render('upwelling_batch_seconds')
+        return '\n'.join(lines) + '\n'
+
+
+# Groups the feature rows of concurrent requests into one model.predict call.
+# A batch is flushed when max_batch rows are queued or when its oldest request
+# has waited max_wait seconds, whichever comes first.
+class MicroBatcher:
+    def __init__(self, model_path, metrics, max_batch=256, max_wait=0.005):
+        self.model_path = model_path
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = []  # (features, future)
+        self._rows = 0
+        self._flush_handle = None
+        self._tasks = set()  # Batches being scored
+
+    async def predict(self, features):
+        # features: (rows, 5) float64 in MODEL_FEATURES order
+        if len(features) == 0:
+            return np.empty(0, dtype=object)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((features, future))
+        self._rows += len(features)
+        if self._rows >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._queue, self._rows = self._queue, [], 0
+        if not batch:
+            return
+        # Scored in a worker thread, so a large batch does not stall the other connections
+        task = asyncio.get_running_loop().create_task(self._score(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _predict(self, rows):
+        # The registry only stats the file here; the model is reloaded when it changes
+        return model_registry.get_model(self.model_path).predict(rows)
+
+    async def _score(self, batch):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            labels = await loop.run_in_executor(None, self._predict, np.vstack([rows for rows, _ in batch]))
+        except Exception as e:
+            if isinstance(e, ValueError) and len(batch) > 1:
+                # Rows the model rejects must not fail the other requests of the batch:
+                # score each request on its own, so only the one they came from gets the error
+                for rows, future in batch:
+                    try:
+                        result = await loop.run_in_executor(None, self._predict, rows)
+                    except Exception as e:
+                        _settle(future, exception=e)
+                    else:
+                        _settle(future, result)
+                return
+            for _, future in batch:
+                _settle(future, exception=e)
+            return
+        self.metrics.batch_seconds.observe(time.perf_counter() - start)
+        self.metrics.batch_size.observe(len(labels))
+        offset = 0
+        for rows, future in batch:
+            _settle(future, labels[offset:offset + len(rows)])
+            offset += len(rows)
+
+
+def _settle(future, result=None, exception=None):
+    # The client may have gone away (cancelled future) while its rows were scored
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+class PredictionService:
+    def __init__(self, model_path=MODEL_PATH, site=DEFAULT_SITE, forecast_path=None, max_batch=256, max_wait=0.005):
+        self.site = site
+        self.forecast_path = forecast_path
+        self.metrics = Metrics()
+        self.batcher = MicroBatcher(model_path, self.metrics, max_batch, max_wait)
+        self._store = None  # (forecast frame, FeatureStore)
+
+    def feature_store(self):
+        # load_data and the forecaster return the same frame until the history (or the
+        # table) changes, so the store is rebuilt only then
+        if self.forecast_path is not None:
+            forecast = load_data(self.forecast_path)
+        else:
+            history = load_data(self.site.history_path)
+            forecast = get_state_forecaster(history, self.site.directory).forecast(FORECAST_HORIZON_DAYS)
+        if self._store is None or self._store[0] is not forecast:
+            store = FeatureStore(forecast if self.forecast_path is not None else forecast.reset_index())
+            self._store = (forecast, store)
+        return self._store[1]
+
+    def forecast_rows(self, query):
+        dates = _requested_dates(query)
+        rows, missing = self.feature_store().lookup(dates)
+        return rows[INDICATOR_COLUMNS], missing
+
+    async def _forecast_rows(self, query):
+        # Off the event loop: reloading the history or fitting the VAR model takes a while
+        return await asyncio.get_running_loop().run_in_executor(None, self.forecast_rows, query)
+
+    async def handle(self, method, path, query, body):
+        if path == '/health':
+            return 200, {'status': 'ok'}
+        if path == '/forecast' and method == 'GET':
+            rows, missing = await self._forecast_rows(query)
+            return 200, {'rows': _records(rows), 'missing': [str(day) for day in missing]}
+        if path == '/predict' and method == 'GET':
+            rows, missing = await self._forecast_rows(query)
+            labels = await self.batcher.predict(rows[MODEL_FEATURES].to_numpy(dtype='float64'))
+            return 200, {'rows': _records(rows, labels), 'missing': [str(day) for day in missing]}
+        if path == '/predict' and method == 'POST':
+            rows = _posted_rows(body)
+            labels = await self.batcher.predict(rows[MODEL_FEATURES].to_numpy(dtype='float64'))
+            return 200, {'rows': _records(rows, labels)}
+        if path in ROUTES:
+            raise HttpError(405, f'{method} is not supported on {path}')
+        raise HttpError(404, f'Unknown path {path}')
+
+
+def _requested_dates(query):
+    try:
+        if 'date' in query:
+            return pd.DatetimeIndex([pd.Timestamp(query['date'][0])])
+        start, end = pd.Timestamp(query['start'][0]), pd.Timestamp(query['end'][0])
+    except KeyError:
+        raise HttpError(400, 'Give either date=YYYY-MM-DD or start=...&end=...')
+    except ValueError as e:
+        raise HttpError(400, f'Invalid date: {e}')
+    if end < start or (end - start).days >= MAX_RANGE_DAYS:
+        raise HttpError(400, f'The range must run forwards and span at most {MAX_RANGE_DAYS} days')
+    return pd.date_range(start, end)
+
+
+def _posted_rows(body):
+    try:
+        payload = json.loads(body or b'{}')
+        rows = payload['rows'] if isinstance(payload, dict) and 'rows' in payload else payload
+        frame = pd.DataFrame(rows if isinstance(rows, list) else [rows])
+    except (ValueError, TypeError, KeyError) as e:
+        raise HttpError(400, f'Invalid request body: {e}')
+    missing = [column for column in MODEL_FEATURES if column not in frame.columns]
+    if missing:
+        raise HttpError(400, f"Missing indicator(s) {', '.join(missing)}")
+    try:
+        frame = frame.astype({column: 'float64' for column in MODEL_FEATURES})
+    except (ValueError, TypeError) as e:
+        raise HttpError(400, f'Invalid request body: {e}')
+    # null, NaN or infinite indicators cannot be classified (nor written back as JSON)
+    invalid = ~np.isfinite(frame[MODEL_FEATURES].to_numpy()).all(axis=1)
+    if invalid.any():
+        rows = ', '.join(str(i) for i in np.flatnonzero(invalid)[:10])
+        raise HttpError(400, f'Row(s) {rows} have missing or non-finite indicators')
+    return frame
+
+
+def _records(rows, labels=None):
+    records = []
+    dates = rows.index.strftime('%Y-%m-%d') if isinstance(rows.index, pd.DatetimeIndex) else None
+    values = rows[INDICATOR_COLUMNS].to_numpy()
+    if values.dtype == np.float32:
+        # Shortest decimal form of the stored float32 values (0.66 instead of 0.6600000262)
+        values = values.astype(str).astype('float64')
+    values = values.tolist()
+    for i, row in enumerate(values):
+        record = dict(zip(INDICATOR_COLUMNS, row))
+        if dates is not None:
+            record = {'DATE': dates[i], **record}
+        if labels is not None:
+            record['Prediksi'] = str(labels[i])
+        records.append(record)
+    return records
+
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+
+async def _read_request(reader):
+    # Request line and headers of one HTTP/1.1 request, or None at end of connection
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, 'Request body too large')
+    body = await reader.readexactly(length) if length else b''
+    return method, target, headers, body
+
+
+def _response(status, payload, content_type='application/json', keep_alive=True):
+    body = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+    head = (f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+    return head.encode() + body
+
+
+def make_handler(service):
+    async def handle_connection(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except (HttpError, ValueError) as e:
+                    status = e.status if isinstance(e, HttpError) else 400
+                    writer.write(_response(status, {'error': str(e)}, keep_alive=False))
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                start = time.perf_counter()
+                url = urlsplit(target)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if url.path == '/metrics':
+                    writer.write(_response(200, service.metrics.render(), 'text/plain; version=0.0.4', keep_alive))
+                else:
+                    try:
+                        status, payload = await service.handle(method, url.path, parse_qs(url.query), body)
+                    except HttpError as e:
+                        status, payload = e.status, {'error': str(e)}
+                    except Exception as e:
+                        status, payload = 500, {'error': str(e)}
+                    writer.write(_response(status, payload, keep_alive=keep_alive))
+                    service.metrics.observe_request(method, url.path, status, time.perf_counter() - start)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    return handle_connection
+
+
+async def serve(host, port, service):
+    # Load the model and the forecast before accepting requests
+    model_registry.get_model(service.batcher.model_path)
+    service.feature_store()
+    server = await asyncio.start_server(make_handler(service), host, port)
+    print(f"Serving on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--site', default=DEFAULT_SITE_ID, help='site whose model and forecast are served')
+    parser.add_argument('--model', default=None, help="default: the site's classifier")
+    parser.add_argument('--forecast', default=None, help='fixed forecast table served by /forecast and /predict '
+                                                         "(default: the site's VAR forecast)")
+    parser.add_argument('--max-batch', type=int, default=256, help='rows that trigger an immediate batch')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0, help='longest wait before a batch is scored')
+    args = parser.parse_args()
+
+    site = get_site(args.site)
+    service = PredictionService(args.model or site.model_path, site, args.forecast,
+                                args.max_batch, args.max_wait_ms / 1000)
+    try:
+        asyncio.run(serve(args.host, args.port, service))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+
+# Every monitored lake or reservoir ("site") has its own directory with the same file
+# layout. The original site, Danau Laut Tawar, lives directly in DATA_DIR; every other
+# site is a subdirectory of SITES_DIR named after its id, e.g.
+#
+#     Dashboard/data/sites/danau-toba/HASIL_CLUSTERING.csv
+#     Dashboard/data/sites/danau-toba/Data_Hasil_Forcast_2_Tahun_(2024-2025).csv
+#     Dashboard/data/sites/danau-toba/model_klasifikasi.pkl      (optional)
+#     Dashboard/data/sites/danau-toba/site.json                  (optional: {"name": "Danau Toba"})
+#
+# A site without its own classifier uses the one in DATA_DIR. Nothing is read from a
+# site directory until a page asks for that site.
+DATA_DIR = 'Dashboard/data'
+SITES_DIR = os.path.join(DATA_DIR, 'sites')
+DEFAULT_SITE_ID = 'laut-tawar'
+
+HISTORY_FILE = 'HASIL_CLUSTERING.csv'
+FORECAST_FILE = 'Data_Hasil_Forcast_2_Tahun_(2024-2025).csv'
+ENSEMBLE_FILE = 'ensemble_forecast.csv'
+MODEL_FILE = 'model_klasifikasi.pkl'
+SITE_FILE = 'site.json'
+
+# Sites whose derived objects (fitted forecaster, aggregate cube, probabilities, feature
+# store, forecast snapshot) are kept in memory at once; the least recently used site's
+# are dropped first. Parsed frames live in the shared dataset cache, bounded by bytes.
+MAX_ACTIVE_SITES = int(os.environ.get('DASHBOARD_MAX_SITES', 8))
+
+
+class Site:
+    def __init__(self, site_id, name, directory):
+        self.id = site_id
+        self.name = name
+        self.directory = directory
+
+    def path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    @property
+    def history_path(self):
+        return self.path(HISTORY_FILE)
+
+    @property
+    def forecast_path(self):
+        return self.path(FORECAST_FILE)
+
+    @property
+    def ensemble_path(self):
+        return self.path(ENSEMBLE_FILE)
+
+    @property
+    def model_path(self):
+        path = self.path(MODEL_FILE)
+        return path if os.path.exists(path) else os.path.join(DATA_DIR, MODEL_FILE)
+
+
+DEFAULT_SITE = Site(DEFAULT_SITE_ID, 'Danau Laut Tawar', DATA_DIR)
+
+
+def _read_site(site_id, directory):
+    name = site_id.replace('-', ' ').title()
+    try:
+        with open(os.path.join(directory, SITE_FILE)) as f:
+            name = json.load(f).get('name', name)
+    except FileNotFoundError:
+        pass
+    return Site(site_id, name, directory)
+
+
+# The site list is rescanned only when SITES_DIR changes (adding or removing a site
+# directory updates its mtime), so listing sites on every rerun costs one os.stat
+_sites = (None, {DEFAULT_SITE_ID: DEFAULT_SITE})
+_sites_lock = threading.Lock()
+
+def list_sites():
+    # {site id: Site}, the default site first
+    global _sites
+    try:
+        mtime_ns = os.stat(SITES_DIR).st_mtime_ns
+    except FileNotFoundError:
+        mtime_ns = None
+    with _sites_lock:
+        if _sites[0] == mtime_ns:
+            return _sites[1]
+        sites = {DEFAULT_SITE_ID: DEFAULT_SITE}
+        if mtime_ns is not None:
+            for entry in sorted(os.scandir(SITES_DIR), key=lambda entry: entry.name):
+                if entry.is_dir() and os.path.exists(os.path.join(entry.path, HISTORY_FILE)):
+                    sites[entry.name] = _read_site(entry.name, entry.path)
+        _sites = (mtime_ns, sites)
+        return sites
+
+
+def get_site(site_id):
+    sites = list_sites()
+    if site_id not in sites:
+        raise KeyError(f"Unknown site {site_id!r}")
+    return sites[site_id]
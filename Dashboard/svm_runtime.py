@@ -0,0 +1,160 @@
+"""Export the SVM classifier to .npz and score it with NumPy only.
+
+Run from the repository root after the classifier changes::
+
+    python Dashboard/svm_runtime.py Dashboard/data/model_klasifikasi.pkl
+
+This writes Dashboard/data/model_klasifikasi.npz with the support vectors,
+dual coefficients, intercept, kernel parameters and (for a StandardScaler +
+SVC pipeline) the scaler. CompiledSVM.load() reads it back without importing
+scikit-learn or joblib; its predictions are those of model.predict.
+"""
+import argparse
+import os
+
+import numpy as np
+
+KERNELS = ('linear', 'poly', 'rbf', 'sigmoid')
+
+
+# Binary SVC decision function in libsvm's own form:
+#     f(x) = sum_i alpha_i * K(sv_i, x) - rho
+# with label classes[0] where f(x) > 0 and classes[1] otherwise, as in libsvm's predict.
+class CompiledSVM:
+    def __init__(self, support_vectors, dual_coef, intercept, classes, kernel, gamma, coef0, degree,
+                 scaler_mean=None, scaler_scale=None, feature_names=None, source_sha256=''):
+        self.support_vectors = np.ascontiguousarray(support_vectors, dtype='float64')
+        self.dual_coef = np.asarray(dual_coef, dtype='float64').reshape(-1)
+        self.intercept = float(intercept)
+        self.classes_ = np.asarray(classes, dtype=object)
+        self.kernel = kernel
+        self.gamma = float(gamma)
+        self.coef0 = float(coef0)
+        self.degree = int(degree)
+        self.scaler_mean = scaler_mean
+        self.scaler_scale = scaler_scale
+        self.feature_names = feature_names
+        self.source_sha256 = source_sha256
+        self._sv_norms = (self.support_vectors ** 2).sum(axis=1)
+
+    @classmethod
+    def from_estimator(cls, model, source_sha256=''):
+        scaler_mean = scaler_scale = None
+        if hasattr(model, 'steps'):
+            # Pipeline: only a StandardScaler may precede the SVC
+            *preprocessing, (_, svc) = model.steps
+            for _, step in preprocessing:
+                if type(step).__name__ != 'StandardScaler':
+                    raise ValueError(f"Cannot export pipeline step {type(step).__name__}")
+                scaler_mean = step.mean_ if step.with_mean else np.zeros(step.n_features_in_)
+                scaler_scale = step.scale_ if step.with_std else np.ones(step.n_features_in_)
+            model = svc
+        if model.kernel not in KERNELS:
+            raise ValueError(f"Cannot export kernel {model.kernel!r}")
+        if len(model.classes_) != 2:
+            raise ValueError("Only binary classifiers can be exported")
+        # _dual_coef_ and _intercept_ are libsvm's values; dual_coef_ and intercept_ have
+        # their sign flipped by scikit-learn for binary problems
+        return cls(model.support_vectors_, model._dual_coef_, model._intercept_[0], model.classes_,
+                   model.kernel, model._gamma, model.coef0, model.degree, scaler_mean, scaler_scale,
+                   getattr(model, 'feature_names_in_', None), source_sha256)
+
+    def save(self, path):
+        arrays = {
+            'support_vectors': self.support_vectors, 'dual_coef': self.dual_coef,
+            'intercept': self.intercept, 'classes': self.classes_.astype(str),
+            'kernel': self.kernel, 'gamma': self.gamma, 'coef0': self.coef0, 'degree': self.degree,
+            'source_sha256': self.source_sha256,
+        }
+        if self.scaler_mean is not None:
+            arrays['scaler_mean'] = self.scaler_mean
+            arrays['scaler_scale'] = self.scaler_scale
+        if self.feature_names is not None:
+            arrays['feature_names'] = np.asarray(self.feature_names, dtype=str)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            optional = {name: data[name] for name in ('scaler_mean', 'scaler_scale', 'feature_names')
+                        if name in data.files}
+            return cls(data['support_vectors'], data['dual_coef'], data['intercept'], data['classes'].tolist(),
+                       str(data['kernel']), data['gamma'], data['coef0'], data['degree'],
+                       source_sha256=str(data['source_sha256']), **optional)
+
+    def _kernel(self, X):
+        if self.kernel == 'rbf':
+            sq = (X ** 2).sum(axis=1)[:, None] + self._sv_norms[None, :] - 2 * (X @ self.support_vectors.T)
+            return np.exp(-self.gamma * np.maximum(sq, 0))
+        dot = X @ self.support_vectors.T
+        if self.kernel == 'linear':
+            return dot
+        if self.kernel == 'poly':
+            return (self.gamma * dot + self.coef0) ** self.degree
+        return np.tanh(self.gamma * dot + self.coef0)
+
+    def _validate(self, X):
+        # The input checks of scikit-learn's predict, with the same ValueError messages
+        X = np.asarray(X, dtype='float64')
+        if X.ndim != 2:
+            raise ValueError(f"Expected 2D array, got {X.ndim}D array instead")
+        if X.shape[0] == 0:
+            raise ValueError(f"Found array with 0 sample(s) (shape={X.shape}) while a minimum of 1 is required by SVC.")
+        if X.shape[1] != self.support_vectors.shape[1]:
+            raise ValueError(f"X has {X.shape[1]} features, but SVC is expecting "
+                             f"{self.support_vectors.shape[1]} features as input.")
+        finite = np.isfinite(X)
+        if not finite.all():
+            if np.isnan(X).any():
+                raise ValueError("Input X contains NaN.")
+            raise ValueError("Input X contains infinity or a value too large for dtype('float64').")
+        return X
+
+    def decision_function(self, X):
+        # Same sign convention as SVC.decision_function: positive means classes_[1]
+        X = self._validate(X)
+        if self.scaler_mean is not None:
+            X = (X - self.scaler_mean) / self.scaler_scale
+        return -(self._kernel(X) @ self.dual_coef + self.intercept)
+
+    def predict(self, X):
+        return self.classes_[(self.decision_function(X) > 0).astype(np.int64)]
+
+
+def compiled_path(model_path):
+    # Exported classifier written next to the pickle
+    return os.path.splitext(model_path)[0] + '.npz'
+
+
+def export(model_path, target=None):
+    import joblib
+    from model_registry import file_sha256
+
+    model = joblib.load(model_path)
+    target = target or compiled_path(model_path)
+    CompiledSVM.from_estimator(model, file_sha256(model_path)).save(target)
+    return model, target
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('model', nargs='?', default='Dashboard/data/model_klasifikasi.pkl')
+    parser.add_argument('--output', default=None, help='default: the model path with .npz')
+    parser.add_argument('--check', nargs='*', default=None,
+                        help='CSV files whose predictions must match the pickled model')
+    args = parser.parse_args()
+
+    model, target = export(args.model, args.output)
+    print(f"{args.model} -> {target} ({os.path.getsize(target)} bytes)")
+
+    if args.check is not None:
+        from web_function import MODEL_FEATURES, load_data
+        compiled = CompiledSVM.load(target)
+        for path in args.check or ['Dashboard/data/HASIL_CLUSTERING.csv']:
+            X = load_data(path)[MODEL_FEATURES].to_numpy(dtype='float64')
+            matches = (compiled.predict(X) == model.predict(X)).sum()
+            print(f"{path}: {matches}/{len(X)} predictions match")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,63 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+import os
+import json
+import threading
+from collections import OrderedDict
+from profiling import timed
+from sites import DEFAULT_SITE_ID, MAX_ACTIVE_SITES
 
-def preprocess_dataframe(df, freq):
-    # Melt DataFrame to combine columns 'date' and 'hour' into 'waktu' and 'curah_hujan'
-    df = pd.melt(df, id_vars=['date'], var_name='hour', value_name='curah_hujan')
-
-    # Transform 'hour' into a datetime format
-    df['hour'] = df['hour'].str.replace('hujan_', '')  # Remove "hujan_"
-    df['hour'] = df['hour'].str.pad(width=4, side='left', fillchar='0')  # Pad 'hour' with leading zeros
-    df['waktu'] = pd.to_datetime(df['date'] + ' ' + df['hour'], format='%Y-%m-%d %H%M')
-
-    # Sort the DataFrame based on the 'waktu' column in ascending order
-    df = df.sort_values(by='waktu', ascending=True)
-
-    # Drop the 'date' and 'hour' columns that are no longer needed
-    df = df.drop(columns=['date', 'hour'])
+def _hour_offsets(labels):
+    # Offset from midnight of every 'hujan_<HHMM>' column label, parsed once per column
+    # (not once per row) with the original format, so invalid labels still raise
+    hours = pd.Index(labels).str.replace('hujan_', '').str.pad(width=4, side='left', fillchar='0')
+    return pd.to_datetime('1970-01-01 ' + hours, format='%Y-%m-%d %H%M') - pd.Timestamp('1970-01-01')
 
-    # Reset the index
-    df = df.reset_index(drop=True)
+@timed
+def preprocess_dataframe(df, freq):
+    # Wide daily rows ('date' plus one 'hujan_<HHMM>' column per hour) to an hourly
+    # 'curah_hujan' series indexed by 'waktu', optionally resampled to freq with gaps
+    # interpolated. df may also be an iterable of such frames (e.g. read_csv(chunksize=...)):
+    # each chunk is reduced to its parsed dates and hour columns as it is read.
+    #
+    # Timestamps are the parsed date plus the hour offset of the column, computed with
+    # datetime arithmetic instead of building and parsing a string per row.
+    chunks = [df] if isinstance(df, pd.DataFrame) else df
+    labels, dates, frames = None, [], []
+    for chunk in chunks:
+        if labels is None:
+            labels = [column for column in chunk.columns if column != 'date']
+        dates.append(pd.to_datetime(chunk['date'], format='%Y-%m-%d').to_numpy())
+        frames.append(chunk[labels])
+    dates = np.concatenate(dates)
+    frame = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    offsets = _hour_offsets(labels).to_numpy().astype(dates.dtype.str.replace('M8', 'm8'))
 
-    # Convert the 'waktu' column to datetime format if it's not already
-    df['waktu'] = pd.to_datetime(df['waktu'], format='%Y-%m-%d %H:%M:%S')
+    hours = np.argsort(offsets, kind='stable')
+    sorted_offsets = offsets[hours]
+    numeric = all(isinstance(dtype, np.dtype) for dtype in frame.dtypes)
+    if (numeric and len(labels) > 0 and sorted_offsets[0] >= np.timedelta64(0)
+            and sorted_offsets[-1] < np.timedelta64(1, 'D') and np.all(np.diff(sorted_offsets) > np.timedelta64(0))
+            and np.all(np.diff(dates) >= np.timedelta64(1, 'D'))):
+        # Increasing days and distinct hours within a day: read day by day, with the hour
+        # columns in time order, the values are already sorted, so no sort is needed
+        waktu = (dates[:, None] + sorted_offsets[None, :]).ravel()
+        curah_hujan = frame.to_numpy()[:, hours].ravel()
+    else:
+        # Same row order as pd.melt (hour by hour) and the same sort as sort_values
+        waktu = (dates[None, :] + offsets[:, None]).ravel()
+        if numeric:
+            curah_hujan = frame.to_numpy().ravel('F')
+        else:
+            curah_hujan = pd.concat([frame[label] for label in labels], ignore_index=True).array
+        # (rows without a date, NaT, go last in their original order, as in sort_values)
+        missing = np.isnat(waktu)
+        sort_order = np.flatnonzero(~missing)[np.argsort(waktu[~missing], kind='quicksort')]
+        sort_order = np.concatenate([sort_order, np.flatnonzero(missing)])
+        waktu, curah_hujan = waktu[sort_order], curah_hujan[sort_order]
 
-    # Set the 'waktu' column as the index
-    df.set_index('waktu', inplace=True)
+    df = pd.DataFrame({'curah_hujan': curah_hujan}, index=pd.DatetimeIndex(waktu, name='waktu'))
 
     # Check if a resampling frequency is provided
     if freq:
@@ -39,18 +72,295 @@ def preprocess_dataframe(df, freq):
         # If resample_freq is empty, return the preprocessed DataFrame without resampling
         return df
 
-def load_data(file_path, index_col=None):
-    # index_col akan diabaikan jika None
-    df = pd.read_csv(file_path, index_col=index_col)
+# Process-wide cache of parsed datasets shared by every page and session.
+# Entries are keyed by file and parse options, invalidated when the file's
+# mtime or size changes, and evicted least-recently-used first once the
+# total in-memory size of the cached frames exceeds max_bytes. Every entry
+# belongs to the directory of its file (one directory per site, see sites.py):
+# a directory holding more than max_partition_bytes drops its own least
+# recently used frames first, so one large site cannot push out the others.
+class DatasetCache:
+    def __init__(self, max_bytes, max_partition_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_partition_bytes = max_partition_bytes or max_bytes
+        self._entries = OrderedDict()  # key -> (signature, DataFrame, nbytes, partition)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return sum(entry[2] for entry in self._entries.values())
+
+    def partition_bytes(self):
+        # {directory: bytes of its cached frames}
+        usage = {}
+        with self._lock:
+            for _, _, nbytes, partition in self._entries.values():
+                usage[partition] = usage.get(partition, 0) + nbytes
+        return usage
+
+    def get(self, key, file_path, loader):
+        # file_path may be a tuple of files the entry is read from; it is stale when any changes
+        paths = file_path if isinstance(file_path, tuple) else (file_path,)
+        signature = tuple((stat.st_mtime_ns, stat.st_size) for stat in map(os.stat, paths))
+        file_path = paths[0]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Parse outside the lock so other sessions are not blocked meanwhile
+        df = loader()
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        partition = os.path.dirname(os.path.abspath(file_path))
+        with self._lock:
+            self._entries[key] = (signature, df, nbytes, partition)
+            self._entries.move_to_end(key)
+            self._evict(partition)
+        return df
+
+    def _evict(self, partition=None):
+        # The most recently used entry is always kept, even if it alone exceeds a cap
+        if partition is not None:
+            keys = [key for key, entry in self._entries.items() if entry[3] == partition]
+            used = sum(self._entries[key][2] for key in keys)
+            for key in keys[:-1]:
+                if used <= self.max_partition_bytes:
+                    break
+                used -= self._entries.pop(key)[2]
+        total = sum(entry[2] for entry in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            total -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Memory caps in megabytes, configurable through the DASHBOARD_CACHE_MB (all sites) and
+# DASHBOARD_SITE_CACHE_MB (per site) environment variables
+dataset_cache = DatasetCache(max_bytes=int(float(os.environ.get('DASHBOARD_CACHE_MB', 256)) * 1024 * 1024),
+                             max_partition_bytes=int(float(os.environ.get('DASHBOARD_SITE_CACHE_MB', 64)) * 1024 * 1024))
+
+def set_cache_limit(max_mb, site_max_mb=None):
+    with dataset_cache._lock:
+        dataset_cache.max_bytes = int(max_mb * 1024 * 1024)
+        if site_max_mb is not None:
+            dataset_cache.max_partition_bytes = int(site_max_mb * 1024 * 1024)
+        for partition in {entry[3] for entry in dataset_cache._entries.values()}:
+            dataset_cache._evict(partition)
+
+# Indicator columns of the normalized dataset schema and their Indonesian display labels
+INDICATOR_COLUMNS = ['ALLSKY_KT', 'T2M', 'PRECTOTCORR', 'PS', 'WS10M']
+INDICATOR_LABELS_ID = {
+    'ALLSKY_KT': 'Indeks Kejernihan Langit',
+    'T2M': 'Suhu Pada Ketinggian 2 Meter',
+    'PRECTOTCORR': 'Curah Hujan',
+    'PS': 'Tekanan Permukaan',
+    'WS10M': 'Kecepatan Angin'
+}
+
+# Feature order expected by the upwelling classifier
+MODEL_FEATURES = ['ALLSKY_KT', 'T2M', 'WS10M', 'PRECTOTCORR', 'PS']
+
+# Climate datasets known to the dashboard, keyed by file name, with the options needed
+# to parse their CSV form. All of them are normalized to the same schema: DATE as
+# datetime64[ns], float32 indicators and (when present) a categorical Status.
+DATASETS = {
+    'HASIL_CLUSTERING.csv': {'delimiter': ',', 'date_format': '%m/%d/%Y', 'columns': {}},
+    'Data_Hasil_Forcast_2_Tahun_(2024-2025).csv': {'delimiter': ',', 'date_format': '%d/%m/%Y', 'columns': {}},
+    'ensemble_forecast.csv': {'delimiter': ',', 'date_format': '%Y-%m-%d', 'columns': {}},
+}
+
+@timed
+def normalize_dataset(df, spec):
+    df = df.rename(columns=spec['columns'])
+    df['DATE'] = pd.to_datetime(df['DATE'], format=spec['date_format']).astype('datetime64[ns]')
+    df[INDICATOR_COLUMNS] = df[INDICATOR_COLUMNS].astype('float32')
+    if 'Status' in df.columns:
+        df['Status'] = df['Status'].astype('category')
     return df
-    
-# Initialize forecast_df as an empty DataFrame
-forecast_df = pd.DataFrame()
 
-def set_forecast_data(df):
-    global forecast_df
-    forecast_df = df.copy()
+def columnar_path(file_path):
+    # Arrow IPC (Feather v2) file written next to the CSV by ingest.py
+    return os.path.splitext(file_path)[0] + '.feather'
+
+def derived_is_fresh(derived, file_path):
+    # True when a file generated from file_path (Feather copy, aggregates) is at least as new as it
+    try:
+        return os.stat(derived).st_mtime_ns >= os.stat(file_path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+@timed
+def read_columnar(path):
+    # Uncompressed Feather files are memory-mapped instead of read into a buffer
+    from pyarrow import feather
+    return feather.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+
+@timed
+def _read_dataset(file_path, index_col, delimiter, date_column, date_format):
+    df = pd.read_csv(file_path, delimiter=delimiter)
+    if date_column is not None:
+        df[date_column] = pd.to_datetime(df[date_column], format=date_format)
+    if index_col is not None:
+        df = df.set_index(index_col)
+    return df
+
+def parts_dir(file_path):
+    # Rows appended to a dataset after its CSV (see power_ingest.py): Feather part files
+    # listed, in append order, by the manifest.json of this directory
+    return os.path.splitext(file_path)[0] + '.parts'
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'parts': []}
+
+@timed
+def _with_parts(df, directory):
+    # Dates already in the CSV keep their CSV row; the result is sorted by DATE
+    parts = [read_columnar(os.path.join(directory, part['file'])) for part in read_manifest(directory)['parts']]
+    df = pd.concat([df] + parts, ignore_index=True)
+    df = df.drop_duplicates('DATE', keep='first').sort_values('DATE', kind='stable', ignore_index=True)
+    if 'Status' in df.columns:
+        df['Status'] = df['Status'].astype('category')
+    return df
+
+@timed
+def _read_known_dataset(file_path, spec, index_col, columnar, parts=None):
+    if columnar is not None:
+        df = read_columnar(columnar)
+    else:
+        df = normalize_dataset(pd.read_csv(file_path, delimiter=spec['delimiter']), spec)
+    if parts is not None:
+        df = _with_parts(df, parts)
+    if index_col is not None:
+        df = df.set_index(index_col)
+    return df
+
+def _pyarrow_available():
+    try:
+        import pyarrow.feather  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+@timed
+def load_data(file_path, index_col=None, delimiter=',', date_column=None, date_format=None, include_parts=True):
+    # index_col akan diabaikan jika None
+    # The returned DataFrame is shared through dataset_cache: treat it as read-only
+    # and copy (or derive a new frame) before modifying it. Known datasets include the
+    # rows appended by power_ingest.py unless include_parts is False.
+    spec = DATASETS.get(os.path.basename(file_path))
+    if spec is None:
+        key = (os.path.abspath(file_path), index_col, delimiter, date_column, date_format)
+        return dataset_cache.get(
+            key, file_path,
+            lambda: _read_dataset(file_path, index_col, delimiter, date_column, date_format))
+
+    # Known datasets are parsed with their spec and always have a DATE column: parse
+    # options that disagree with it are an error rather than silently ignored
+    if delimiter != spec['delimiter'] or date_column not in (None, 'DATE') \
+            or date_format not in (None, spec['date_format']):
+        raise ValueError(f"{os.path.basename(file_path)} is read with delimiter={spec['delimiter']!r}, "
+                         f"date_column='DATE' and date_format={spec['date_format']!r}")
+
+    # Known datasets are read from their columnar copy when it is up to date,
+    # falling back to parsing the CSV into the same normalized schema
+    columnar = columnar_path(file_path)
+    if not (derived_is_fresh(columnar, file_path) and _pyarrow_available()):
+        columnar = None
+    source = columnar or file_path
+    parts = parts_dir(file_path)
+    manifest = os.path.join(parts, 'manifest.json')
+    if not (include_parts and os.path.exists(manifest) and _pyarrow_available()):
+        parts = None
+    key = (os.path.abspath(source), index_col, parts is not None)
+    return dataset_cache.get(
+        key, source if parts is None else (source, manifest),
+        lambda: _read_known_dataset(file_path, spec, index_col, columnar, parts))
+
+# Immutable, versioned snapshot of the forecast table
+class ForecastSnapshot:
+    def __init__(self, version, frame, source=None, model_version=None):
+        self.version = version
+        self._frame = frame
+        # Frame the snapshot was built from (frame itself unless columns were added to it)
+        # and the model (sha256) its derived columns, such as probabilities, belong to
+        self._source = frame if source is None else source
+        self.model_version = model_version
+
+    @property
+    def data(self):
+        # Shallow, copy-free view: with pandas copy-on-write any modification made
+        # by the reader copies the touched columns and never alters the snapshot
+        return self._frame.copy(deep=False)
+
+    def is_of(self, frame, model_version=None):
+        return self._source is frame and self.model_version == model_version
+
+
+# Thread-safe store shared by every session. Writers swap in a new snapshot
+# atomically; readers keep whatever snapshot they fetched, so a concurrent
+# write never changes data underneath a running page. Pages can subscribe() to
+# drop their derived caches on every write; the Prediction page also checks the
+# snapshot identity of its cached view (see predict.get_feature_store).
+class ForecastStore:
+    def __init__(self):
+        self._snapshot = ForecastSnapshot(0, pd.DataFrame())
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        return self._snapshot
+
+    def set(self, df, source=None, model_version=None):
+        # The store takes ownership of df: the caller must not modify it afterwards
+        with self._lock:
+            snapshot = ForecastSnapshot(self._snapshot.version + 1, df, source, model_version)
+            self._snapshot = snapshot
+            listeners = list(self._listeners)
+        for callback in listeners:
+            callback(snapshot)
+        return snapshot
+
+    def subscribe(self, callback):
+        # callback(snapshot) is called after every write; returns a function that unsubscribes
+        with self._lock:
+            self._listeners.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._listeners:
+                    self._listeners.remove(callback)
+        return unsubscribe
+
+
+forecast_store = ForecastStore()
+
+# One store per site: forecast_store belongs to the default site and is always kept;
+# the stores of other sites are dropped least recently used first beyond MAX_ACTIVE_SITES
+# (sessions keep the snapshots they already hold)
+_site_forecast_stores = OrderedDict()
+_site_forecast_stores_lock = threading.Lock()
 
-def get_forecast_data():
-    global forecast_df
-    return forecast_df.copy()
\ No newline at end of file
+def get_forecast_store(site_id=DEFAULT_SITE_ID):
+    if site_id == DEFAULT_SITE_ID:
+        return forecast_store
+    with _site_forecast_stores_lock:
+        store = _site_forecast_stores.get(site_id)
+        if store is None:
+            store = _site_forecast_stores[site_id] = ForecastStore()
+            while len(_site_forecast_stores) > MAX_ACTIVE_SITES:
+                _site_forecast_stores.popitem(last=False)
+        _site_forecast_stores.move_to_end(site_id)
+        return store